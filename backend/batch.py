@@ -0,0 +1,102 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from urllib.parse import urljoin
+from pipeline import run_pipeline
+from shared_work import SharedWork
+from browser_pool import get_browser_pool
+from scraper import close_http_client
+
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+DEFAULT_BASE_URL = "https://www.thermofisher.com/"
+
+
+async def run_batch(urls, concurrency=BATCH_CONCURRENCY, shared=None):
+    """
+    Process many URLs together, yielding one result dict per URL as soon as
+    that page finishes (not in input order).
+
+    Pages are scraped with the worker's shared browser pool, and share one
+    SharedWork memo so keywords common to several pages are embedded,
+    classified and looked up only once.
+    """
+    urls = list(dict.fromkeys(urls))
+    shared = shared or SharedWork()
+    semaphore = asyncio.Semaphore(concurrency)
+    # Set before the batch cancels its own tasks
+    stopping = asyncio.Event()
+
+    async def process(url):
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                result = await run_pipeline(url, shared=shared)
+                return {"url": url, "status": "completed", "result": result}
+            except asyncio.CancelledError as e:
+                if stopping.is_set():
+                    raise
+                # Cancellation of something this page awaited, not of the
+                # batch: it only fails this URL
+                logging.error(f"Batch processing cancelled for URL {url}")
+                return {"url": url, "status": "failed", "error": str(e) or "Cancelled"}
+            except Exception as e:
+                logging.error(f"Batch processing failed for URL {url}: {e}")
+                return {"url": url, "status": "failed", "error": str(e)}
+            finally:
+                logging.info(
+                    f"Batch URL {url} finished in {time.perf_counter() - started:.2f}s"
+                )
+
+    tasks = [asyncio.create_task(process(url)) for url in urls]
+    try:
+        for task in asyncio.as_completed(tasks):
+            yield await task
+    finally:
+        stopping.set()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        logging.info(f"Batch shared work stats: {shared.stats}")
+
+
+def read_urls(path, base_url=DEFAULT_BASE_URL):
+    """
+    Read one URL per line from `path` (e.g. url.txt). Relative paths are
+    resolved against `base_url`; blank lines and header lines are skipped.
+    """
+    urls = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#") or "/" not in line:
+                continue
+            urls.append(urljoin(base_url, line))
+    return urls
+
+
+async def main(args):
+    urls = read_urls(args.input, args.base_url)
+    logging.info(f"Processing {len(urls)} URLs from {args.input}")
+    try:
+        with open(args.output, "w", encoding="utf-8") as f:
+            async for item in run_batch(urls, concurrency=args.concurrency):
+                f.write(json.dumps(item, default=str) + "\n")
+                f.flush()
+                print(f"{item['status']}: {item['url']}")
+    finally:
+        await get_browser_pool().close()
+        await close_http_client()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Run the process_row pipeline for every URL in a file."
+    )
+    parser.add_argument("input", help="File with one URL or URL path per line")
+    parser.add_argument("--output", default="batch_results.jsonl")
+    parser.add_argument("--base-url", default=DEFAULT_BASE_URL)
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,139 @@
+import asyncio
+import logging
+import os
+import threading
+from contextlib import asynccontextmanager
+from playwright.async_api import async_playwright
+
+# Pages allowed open at the same time across all scrapes of this worker process
+BROWSER_MAX_PAGES = int(os.getenv("BROWSER_MAX_PAGES", "8"))
+# Pages served by one browser before it is replaced, to bound its memory growth
+BROWSER_RECYCLE_AFTER = int(os.getenv("BROWSER_RECYCLE_AFTER", "200"))
+
+
+class BrowserPool:
+    """
+    Long-lived Chromium shared by every scrape of the worker process.
+
+    Launching a browser takes seconds, so it is started once and each scrape
+    gets its own browser context (separate cookies, cache and storage) with a
+    single page, closed when the scrape ends. A semaphore caps the number of
+    open pages. The browser is replaced after `recycle_after` pages or when it
+    has crashed; a replaced browser is closed once its last page is done.
+    """
+
+    def __init__(self, max_pages=BROWSER_MAX_PAGES, recycle_after=BROWSER_RECYCLE_AFTER):
+        self.max_pages = max_pages
+        self.recycle_after = recycle_after
+        self._lock = None
+        self._semaphore = None
+        self._playwright = None
+        self._browser = None
+        self._served = 0
+        self._active = {}
+        self.stats = {"launches": 0, "pages": 0, "crashes": 0}
+
+    def _primitives(self):
+        # Created lazily so they belong to the event loop the pool is used on
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+            self._semaphore = asyncio.Semaphore(self.max_pages)
+        return self._lock, self._semaphore
+
+    async def start(self):
+        lock, _ = self._primitives()
+        async with lock:
+            await self._current_browser()
+
+    async def _current_browser(self):
+        """The browser to open new pages on, launched or replaced if needed"""
+        browser = self._browser
+        if browser is not None and browser.is_connected() and self._served < self.recycle_after:
+            return browser
+
+        if browser is not None:
+            if not browser.is_connected():
+                self.stats["crashes"] += 1
+                logging.warning("Browser disconnected, launching a new one")
+            else:
+                logging.info(f"Recycling browser after {self._served} pages")
+            self._browser = None
+            if not self._active.get(browser):
+                await self._close_browser(browser)
+
+        if self._playwright is None:
+            self._playwright = await async_playwright().start()
+        self._browser = await self._playwright.chromium.launch()
+        self._served = 0
+        self.stats["launches"] += 1
+        logging.info("Launched browser for the scraper pool")
+        return self._browser
+
+    async def _close_browser(self, browser):
+        self._active.pop(browser, None)
+        try:
+            await browser.close()
+        except Exception as e:
+            logging.warning(f"Error closing browser: {e}")
+
+    @asynccontextmanager
+    async def page(self, **context_options):
+        """Yields a page in a fresh browser context; both are closed afterwards"""
+        lock, semaphore = self._primitives()
+        async with semaphore:
+            async with lock:
+                browser = await self._current_browser()
+                self._served += 1
+                self._active[browser] = self._active.get(browser, 0) + 1
+                self.stats["pages"] += 1
+
+            context = None
+            try:
+                context = await browser.new_context(**context_options)
+                yield await context.new_page()
+            finally:
+                if context is not None and browser.is_connected():
+                    try:
+                        await context.close()
+                    except Exception as e:
+                        logging.warning(f"Error closing browser context: {e}")
+                async with lock:
+                    # Missing when the pool was closed while the page was open
+                    if browser in self._active:
+                        self._active[browser] -= 1
+                        if browser is not self._browser and not self._active[browser]:
+                            await self._close_browser(browser)
+
+    def snapshot(self):
+        return {
+            **self.stats,
+            "open_pages": sum(self._active.values()),
+            "max_pages": self.max_pages,
+            "pages_on_current_browser": self._served,
+            "recycle_after": self.recycle_after,
+        }
+
+    async def close(self):
+        browsers = set(self._active)
+        if self._browser is not None:
+            browsers.add(self._browser)
+        for browser in browsers:
+            await self._close_browser(browser)
+        self._browser = None
+        self._lock = self._semaphore = None
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+        logging.info("Closed scraper browser pool")
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_browser_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = BrowserPool()
+        return _pool
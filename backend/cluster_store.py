@@ -0,0 +1,149 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+import faiss
+import numpy as np
+
+CLUSTER_STORE_PATH = os.getenv("CLUSTER_STORE_PATH", "cluster_store.sqlite")
+# Minimum cosine similarity between a keyword and a cluster representative
+CLUSTER_SIMILARITY = float(os.getenv("CLUSTER_SIMILARITY", "0.85"))
+# HNSW parameters of the representative index
+CLUSTER_HNSW_M = 32
+CLUSTER_HNSW_EF_SEARCH = 64
+
+
+def normalize_rows(vectors):
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+
+class ClusterStore:
+    """
+    Keyword clusters persisted across requests.
+
+    Each cluster keeps a representative vector (the normalised centroid of the
+    keywords it was created from) and its generated topic and subtopic. The
+    representatives are searched with an HNSW inner-product index, so assigning
+    a keyword takes O(log n) regardless of how many clusters exist. Clusters
+    added by other worker processes are picked up from SQLite before each
+    search.
+    """
+
+    def __init__(self, path=CLUSTER_STORE_PATH, min_similarity=CLUSTER_SIMILARITY):
+        self.path = path
+        self.min_similarity = min_similarity
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS clusters (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                topic TEXT,
+                subtopic TEXT,
+                size INTEGER NOT NULL,
+                vector BLOB NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """
+        )
+        self._conn.commit()
+        self._index = None
+        self._labels = {}
+        self._loaded_id = 0
+
+    def _refresh(self):
+        rows = self._conn.execute(
+            "SELECT id, topic, subtopic, vector FROM clusters WHERE id > ? ORDER BY id",
+            (self._loaded_id,),
+        ).fetchall()
+        if not rows:
+            return
+        vectors = np.vstack([np.frombuffer(row[3], dtype=np.float32) for row in rows])
+        if self._index is None:
+            hnsw = faiss.IndexHNSWFlat(
+                vectors.shape[1], CLUSTER_HNSW_M, faiss.METRIC_INNER_PRODUCT
+            )
+            hnsw.hnsw.efSearch = CLUSTER_HNSW_EF_SEARCH
+            self._index = faiss.IndexIDMap2(hnsw)
+        ids = np.array([row[0] for row in rows], dtype="int64")
+        self._index.add_with_ids(vectors, ids)
+        for cluster_id, topic, subtopic, _ in rows:
+            self._labels[cluster_id] = (topic, subtopic)
+        self._loaded_id = int(ids[-1])
+
+    def _nearest(self, vectors):
+        if self._index is None or self._index.ntotal == 0:
+            return np.full(len(vectors), -1), np.zeros(len(vectors))
+        similarities, ids = self._index.search(vectors, 1)
+        matched = similarities[:, 0] >= self.min_similarity
+        return np.where(matched, ids[:, 0], -1), similarities[:, 0]
+
+    def assign(self, vectors):
+        """
+        Nearest stored cluster of each vector.
+        Returns: list of (cluster_id, topic, subtopic), cluster_id -1 (and no
+        labels) where no cluster is within the similarity threshold
+        """
+        vectors = normalize_rows(vectors)
+        with self._lock:
+            self._refresh()
+            cluster_ids, _ = self._nearest(vectors)
+            assigned = []
+            for cluster_id in cluster_ids:
+                topic, subtopic = self._labels.get(int(cluster_id), (None, None))
+                assigned.append((int(cluster_id), topic, subtopic))
+
+            counts = np.unique(cluster_ids[cluster_ids >= 0], return_counts=True)
+            self._conn.executemany(
+                "UPDATE clusters SET size = size + ? WHERE id = ?",
+                [(int(n), int(i)) for i, n in zip(*counts)],
+            )
+            self._conn.commit()
+        return assigned
+
+    def add(self, vectors, topic, subtopic):
+        """
+        Store a new cluster made of `vectors` with its labels. If another
+        request stored a matching cluster in the meantime, that one is kept.
+        Returns: (cluster_id, topic, subtopic)
+        """
+        centroid = normalize_rows(normalize_rows(vectors).mean(axis=0, keepdims=True))
+        with self._lock:
+            self._refresh()
+            cluster_ids, _ = self._nearest(centroid)
+            if cluster_ids[0] >= 0:
+                existing = int(cluster_ids[0])
+                return (existing, *self._labels[existing])
+
+            cursor = self._conn.execute(
+                "INSERT INTO clusters (topic, subtopic, size, vector, created_at) VALUES (?, ?, ?, ?, ?)",
+                (topic, subtopic, len(vectors), centroid[0].tobytes(), time.time()),
+            )
+            self._conn.commit()
+            self._refresh()
+            logging.info(f"Stored new cluster {cursor.lastrowid}: {topic} | {subtopic}")
+            return cursor.lastrowid, topic, subtopic
+
+    def stats(self):
+        with self._lock:
+            count, keywords = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM clusters"
+            ).fetchone()
+        return {"clusters": count, "keywords_assigned": keywords}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_cluster_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ClusterStore()
+        return _store
@@ -1,28 +1,47 @@
+import faiss
 import numpy as np
+from scipy.sparse import csr_matrix
 from sklearn.cluster import DBSCAN
 import pandas as pd
 import json
 from topic_generation import process_row_parallel, extract_topic_subtopic
 
 
-def calculate_similarity_matrix(embeddings: np.ndarray) -> np.ndarray:
+# Number of query vectors per FAISS range search, bounds the temporary result size
+RANGE_SEARCH_BATCH_SIZE = 4096
+
+
+def build_neighbourhood_graph(embeddings: np.ndarray, min_similarity: float) -> csr_matrix:
     """
-    Calculate pairwise cosine similarity matrix.
-    Uses optimized matrix multiplication for speed.
+    Sparse cosine distance graph holding only the pairs with similarity of at
+    least `min_similarity`, found with a FAISS range search. Memory grows with
+    the number of close pairs instead of n².
+    Rows must be L2-normalised.
     """
     try:
-        # Ensure embeddings are normalized and handle zero vectors
-        norms = np.linalg.norm(embeddings, axis=1)
-        # Replace zero norms with 1 to avoid division by zero
-        norms[norms == 0] = 1
-        embeddings_normalized = embeddings / norms[:, np.newaxis]
-        # Calculate similarity matrix
-        similarity_matrix = np.dot(embeddings_normalized, embeddings_normalized.T)
-        # Ensure values are between -1 and 1
-        similarity_matrix = np.clip(similarity_matrix, -1, 1)
-        return similarity_matrix
+        embeddings = np.ascontiguousarray(embeddings, dtype="float32")
+        index = faiss.IndexFlatIP(embeddings.shape[1])
+        index.add(embeddings)
+
+        # Slightly lower radius so pairs exactly at the threshold are kept
+        radius = min_similarity - 1e-6
+        indptr, indices, distances = [np.array([0], dtype="int64")], [], []
+        for start in range(0, len(embeddings), RANGE_SEARCH_BATCH_SIZE):
+            lims, similarities, ids = index.range_search(
+                embeddings[start : start + RANGE_SEARCH_BATCH_SIZE], radius
+            )
+            indptr.append(lims[1:] + indptr[-1][-1])
+            indices.append(ids)
+            # Ensure all distances are non-negative
+            distances.append(np.clip(1 - similarities, 0, 2))
+
+        n = len(embeddings)
+        return csr_matrix(
+            (np.concatenate(distances), np.concatenate(indices), np.concatenate(indptr)),
+            shape=(n, n),
+        )
     except Exception as e:
-        print(f"Error in calculate_similarity_matrix: {str(e)}")
+        print(f"Error in build_neighbourhood_graph: {str(e)}")
         raise
 
 
@@ -62,31 +81,33 @@ def cluster_existing_embeddings(
         embeddings = np.array(embeddings_list)
         print(f"Embeddings shape: {embeddings.shape}")
 
-        print("Calculating similarity matrix...")
-        similarity_matrix = calculate_similarity_matrix(embeddings)
-
-        # Convert similarity to distance and ensure non-negative values
-        print("Preparing distance matrix...")
-        distance_matrix = 1 - similarity_matrix
-        # Ensure all distances are non-negative
-        distance_matrix = np.abs(distance_matrix)
+        # Normalise. Zero vectors (invalid embeddings) are similar to nothing
+        # and are labelled noise (-1), as before: the dense distance matrix
+        # gave them distance 1 to every point, themselves included, so DBSCAN
+        # never placed them in a cluster
+        norms = np.linalg.norm(embeddings, axis=1)
+        valid = norms > 0
+        embeddings_normalized = embeddings[valid] / norms[valid][:, np.newaxis]
 
-        print(f"Distance matrix shape: {distance_matrix.shape}")
-        print(f"Distance range: [{distance_matrix.min()}, {distance_matrix.max()}]")
+        print("Building neighbourhood graph...")
+        distance_graph = build_neighbourhood_graph(embeddings_normalized, min_similarity)
+        print(f"Neighbourhood graph: {distance_graph.shape}, {distance_graph.nnz} pairs")
 
         # Perform clustering
         print("Performing clustering...")
         eps = 1 - min_similarity  # Convert similarity threshold to distance
-        clustering = DBSCAN(eps=eps, min_samples=min_samples, metric="precomputed").fit(
-            distance_matrix
-        )
+        labels = np.full(len(embeddings), -1)
+        if valid.any():
+            labels[valid] = DBSCAN(
+                eps=eps, min_samples=min_samples, metric="precomputed"
+            ).fit(distance_graph).labels_
 
         # Add cluster labels to DataFrame
         df_with_clusters = df.copy()
-        df_with_clusters["cluster_id"] = clustering.labels_
+        df_with_clusters["cluster_id"] = labels
 
         print(
-            f"Number of clusters found: {len(set(clustering.labels_)) - (1 if -1 in clustering.labels_ else 0)}"
+            f"Number of clusters found: {len(set(labels)) - (1 if -1 in labels else 0)}"
         )
         return df_with_clusters
 
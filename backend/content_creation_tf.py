@@ -1,7 +1,7 @@
 import pandas as pd
 from ast import literal_eval
 import logging
-from openai import OpenAI
+from llm_gateway import chat_completion
 import re
 from bs4 import BeautifulSoup
 import pandas as pd
@@ -61,13 +61,12 @@ def validate_and_fix_html(content: str) -> str:
 
 
 def run_openai_api(keywords, content_structure, row):
-    client = OpenAI(api_key=OPENAI_API_KEY)
     PROMPT = generate_prompt(keywords, content_structure, row)
     try:
         prompt = generate_prompt(keywords, content_structure, row)
 
-        response = client.chat.completions.create(
-            model="gpt-4.1",  # "gpt-4o-2024-05-13",  # Update this to your specific model
+        response = chat_completion(
+            "content_optimization",
             messages=[
                 {
                     "role": "system",
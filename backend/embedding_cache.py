@@ -0,0 +1,200 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+import numpy as np
+
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite")
+# Size limit of the on-disk store; least recently used vectors are evicted past it
+EMBEDDING_CACHE_MAX_BYTES = int(
+    os.getenv("EMBEDDING_CACHE_MAX_BYTES", str(1024 * 1024 * 1024))
+)
+# Number of vectors kept in the in-process LRU layer
+EMBEDDING_CACHE_MEMORY_ITEMS = int(os.getenv("EMBEDDING_CACHE_MEMORY_ITEMS", "50000"))
+
+
+def normalize_text(text):
+    """Canonical form of a text for embedding and cache lookups."""
+    text = unicodedata.normalize("NFKC", text)
+    return " ".join(text.split())
+
+
+def cache_key(model, text):
+    return hashlib.sha256(f"{model}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding store keyed by (model, normalised text).
+
+    Vectors are stored as float32 blobs in SQLite, which is safe to share
+    between worker processes, with an in-process LRU layer in front of it.
+    When the store grows past `max_bytes` the least recently used vectors
+    are evicted.
+    """
+
+    def __init__(
+        self,
+        path=EMBEDDING_CACHE_PATH,
+        max_bytes=EMBEDDING_CACHE_MAX_BYTES,
+        memory_items=EMBEDDING_CACHE_MEMORY_ITEMS,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.memory_items = memory_items
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings (last_access)"
+        )
+        self._conn.commit()
+        self._size = None
+        self._counts = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+    def get_many(self, model, texts):
+        """Returns: {text: vector} for the texts found in the cache"""
+        keys = {text: cache_key(model, text) for text in texts}
+        found, missing = {}, {}
+        with self._lock:
+            for text, key in keys.items():
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    found[text] = vector
+                    self._counts["memory_hits"] += 1
+                else:
+                    missing.setdefault(key, []).append(text)
+
+            if missing:
+                rows = self._select(list(missing))
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE key = ?",
+                    [(now, key) for key in rows],
+                )
+                self._conn.commit()
+                for key, vector in rows.items():
+                    self._remember(key, vector)
+                    for text in missing[key]:
+                        found[text] = vector
+                    self._counts["disk_hits"] += len(missing[key])
+                self._counts["misses"] += sum(
+                    len(texts) for key, texts in missing.items() if key not in rows
+                )
+        return found
+
+    def get(self, model, text):
+        return self.get_many(model, [text]).get(text)
+
+    def put_many(self, model, vectors):
+        """Store {text: vector} for `model`"""
+        now = time.time()
+        rows = []
+        with self._lock:
+            for text, vector in vectors.items():
+                key = cache_key(model, text)
+                vector = np.asarray(vector, dtype=np.float32)
+                self._remember(key, vector)
+                rows.append((key, model, vector.tobytes(), now))
+                if self._size is not None:
+                    self._size += vector.nbytes
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, vector, last_access) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            self._conn.commit()
+            self._evict()
+
+    def _select(self, keys):
+        rows = {}
+        # Stay below SQLite's limit on the number of query parameters
+        for start in range(0, len(keys), 500):
+            chunk = keys[start : start + 500]
+            cursor = self._conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})",
+                chunk,
+            )
+            for key, blob in cursor:
+                rows[key] = np.frombuffer(blob, dtype=np.float32)
+        return rows
+
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def _evict(self):
+        if self._size is None or self._size > self.max_bytes:
+            # The running total is approximate (replaced rows, other processes),
+            # so check the real size before evicting
+            self._size = self.size_bytes()
+        if self._size <= self.max_bytes:
+            return
+
+        size = self._size
+        # Evict down to 90% of the limit so eviction doesn't run on every write
+        target = int(self.max_bytes * 0.9)
+        cursor = self._conn.execute(
+            "SELECT key, length(vector) FROM embeddings ORDER BY last_access"
+        )
+        evicted = []
+        for key, length in cursor:
+            if size <= target:
+                break
+            evicted.append((key,))
+            size -= length
+        self._conn.executemany("DELETE FROM embeddings WHERE key = ?", evicted)
+        self._conn.commit()
+        self._size = size
+        for (key,) in evicted:
+            self._memory.pop(key, None)
+        logging.info(f"Evicted {len(evicted)} embeddings from {self.path}")
+
+    def size_bytes(self):
+        return self._conn.execute(
+            "SELECT COALESCE(SUM(length(vector)), 0) FROM embeddings"
+        ).fetchone()[0]
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self._counts)
+            entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            size = self.size_bytes()
+        lookups = sum(counts.values())
+        hits = counts["memory_hits"] + counts["disk_hits"]
+        return {
+            **counts,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "entries": entries,
+            "size_bytes": size,
+            "memory_entries": len(self._memory),
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = EmbeddingCache()
+        return _cache
@@ -0,0 +1,175 @@
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+import numpy as np
+from embedding_cache import get_cache, normalize_text
+from llm_gateway import get_gateway, model_for
+
+EMBEDDING_MODEL = model_for("embedding")
+# Maximum number of texts sent in one embeddings request (the API accepts 2048)
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "512"))
+# Seconds to wait for more texts from concurrent callers before sending a batch
+EMBEDDING_BATCH_WAIT = float(os.getenv("EMBEDDING_BATCH_WAIT", "0.02"))
+# Number of batch requests allowed in flight at the same time
+EMBEDDING_MAX_CONCURRENT_REQUESTS = int(
+    os.getenv("EMBEDDING_MAX_CONCURRENT_REQUESTS", "4")
+)
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "1") == "1"
+
+
+class EmbeddingBatcher:
+    """
+    Coalesces embedding requests from concurrent callers into multi-input
+    requests.
+
+    `submit` queues a text and returns a Future. A background thread collects
+    pending texts for up to `max_wait` seconds (or until `batch_size` texts are
+    waiting), sends them in one embeddings request and resolves every caller's
+    future with its own vector. Identical texts in a batch are sent once.
+    Texts found in `cache` (an EmbeddingCache) are answered without a request
+    and new vectors are written back to it.
+    """
+
+    def __init__(
+        self,
+        client=None,
+        model=EMBEDDING_MODEL,
+        batch_size=EMBEDDING_BATCH_SIZE,
+        max_wait=EMBEDDING_BATCH_WAIT,
+        max_concurrent_requests=EMBEDDING_MAX_CONCURRENT_REQUESTS,
+        cache=None,
+    ):
+        # Requests go through the gateway's rate limiter unless a client is given
+        self.create_embeddings = (
+            client.embeddings.create if client else get_gateway().embeddings
+        )
+        self.cache = cache
+        self.model = model
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self._pending = queue.Queue()
+        self._senders = ThreadPoolExecutor(
+            max_workers=max_concurrent_requests, thread_name_prefix="embedding-batch"
+        )
+        self._lock = threading.Lock()
+        self._thread = None
+        self.stats = {"texts": 0, "requests": 0}
+
+    def submit(self, text):
+        return self.submit_many([text])[0]
+
+    def submit_many(self, texts):
+        texts = [normalize_text(text) for text in texts]
+        if not all(texts):
+            raise ValueError("Cannot embed an empty text")
+        cached = self.cache.get_many(self.model, texts) if self.cache else {}
+
+        futures = []
+        for text in texts:
+            future = Future()
+            if text in cached:
+                future.set_result(cached[text])
+            else:
+                self._ensure_started()
+                self._pending.put((text, future))
+            futures.append(future)
+        return futures
+
+    def embed(self, text):
+        return self.submit(text).result()
+
+    def embed_many(self, texts):
+        return [future.result() for future in self.submit_many(texts)]
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._collect, name="embedding-batcher", daemon=True
+                )
+                self._thread.start()
+
+    def _collect(self):
+        while True:
+            batch = [self._pending.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._pending.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._senders.submit(self._send, batch)
+
+    def _send(self, batch):
+        futures_by_text = {}
+        for text, future in batch:
+            futures_by_text.setdefault(text, []).append(future)
+        texts = list(futures_by_text)
+
+        try:
+            vectors = self._request(texts)
+        except Exception as e:
+            for futures in futures_by_text.values():
+                for future in futures:
+                    future.set_exception(e)
+            return
+
+        if self.cache:
+            try:
+                self.cache.put_many(self.model, dict(zip(texts, vectors)))
+            except Exception as e:
+                logging.error(f"Error writing embeddings to cache: {e}")
+
+        for text, vector in zip(texts, vectors):
+            for future in futures_by_text[text]:
+                future.set_result(vector)
+
+    def _request(self, texts):
+        # Rate limits and transient errors are handled by the gateway (see llm_gateway)
+        response = self.create_embeddings(input=texts, model=self.model)
+        # Requests are sent from several threads
+        with self._lock:
+            self.stats["texts"] += len(texts)
+            self.stats["requests"] += 1
+        data = sorted(response.data, key=lambda item: item.index)
+        return [np.array(item.embedding, dtype=np.float32) for item in data]
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats)
+
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+
+def get_batcher():
+    global _batcher
+    with _batcher_lock:
+        if _batcher is None:
+            _batcher = EmbeddingBatcher(
+                cache=get_cache() if EMBEDDING_CACHE_ENABLED else None
+            )
+        return _batcher
+
+
+def embed_text(text):
+    return get_batcher().embed(text)
+
+
+def embed_texts(texts):
+    return get_batcher().embed_many(texts)
+
+
+def embedding_stats():
+    batcher = get_batcher()
+    return {
+        "requests": batcher.snapshot(),
+        "cache": batcher.cache.stats() if batcher.cache else None,
+    }
@@ -1,5 +1,5 @@
 import logging
-from openai import OpenAI
+from llm_gateway import chat_completion
 import re
 import os
 from dotenv import load_dotenv
@@ -56,13 +56,11 @@ def validate_and_fix_html(content: str) -> str:
 
 
 def run_openai_api(raw_content):
-    client = OpenAI(api_key=OPENAI_API_KEY)
-
     try:
         prompt = generate_prompt(raw_content)
 
-        response = client.chat.completions.create(
-            model="gpt-4o-mini-2024-07-18",  # Update this to your specific model
+        response = chat_completion(
+            "content_formatting",
             messages=[
                 {
                     "role": "system",
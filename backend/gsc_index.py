@@ -0,0 +1,230 @@
+import argparse
+import logging
+import time
+import faiss
+import numpy as np
+import pandas as pd
+
+GSC_EMBEDDING_TABLE = "thermofigher-gen-ai.searchconsole.filtered_gsc_data_embedding"
+
+# Default build parameters per index kind
+INDEX_DEFAULTS = {
+    "flat": {},
+    "hnsw": {"m": 32, "ef_construction": 200, "ef_search": 64},
+    "ivfpq": {"nlist": None, "pq_m": 64, "nbits": 8, "nprobe": 16},
+}
+
+# Search settings compared by the recall/latency report
+REPORT_SWEEP = {
+    "hnsw": [16, 32, 64, 128, 256],
+    "ivfpq": [1, 4, 16, 64, 128],
+}
+
+
+def normalize_embeddings(embeddings):
+    embeddings = np.ascontiguousarray(embeddings, dtype="float32")
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return embeddings / norms
+
+
+def load_embeddings_from_index(path):
+    """Recover the stored vectors of an existing flat index (e.g. faiss_TF_index.bin)"""
+    index = faiss.read_index(path)
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def load_gsc_embeddings(table=GSC_EMBEDDING_TABLE):
+    """Returns: DataFrame of query and embedding from the BigQuery table"""
+    from google.cloud import bigquery
+
+    bq_client = bigquery.Client()
+    return bq_client.query(f"SELECT query, embedding FROM `{table}`").to_dataframe()
+
+
+def load_embeddings_from_bigquery(table=GSC_EMBEDDING_TABLE):
+    df = load_gsc_embeddings(table)
+    return np.array(df["embedding"].tolist(), dtype="float32")
+
+
+def load_embeddings(args):
+    if args.from_index:
+        return load_embeddings_from_index(args.from_index)
+    if args.from_npy:
+        return np.load(args.from_npy)
+    return load_embeddings_from_bigquery(args.from_bigquery)
+
+
+def default_nlist(n):
+    # Rule of thumb: about 4 * sqrt(n) lists, each trained with >= 39 points
+    return max(1, min(int(4 * np.sqrt(n)), n // 39))
+
+
+def build_index(vectors, kind="hnsw", ids=None, **params):
+    """
+    Build an inner-product index over L2-normalised vectors, so search scores
+    are cosine similarities.
+
+    kind: "flat" (exact), "hnsw" or "ivfpq".
+    ids: optional int64 ids stored with the vectors (see gsc_ingest.py)
+    """
+    vectors = normalize_embeddings(vectors)
+    n, d = vectors.shape
+    params = {**INDEX_DEFAULTS[kind], **{k: v for k, v in params.items() if v is not None}}
+
+    if kind == "flat":
+        index = faiss.IndexFlatIP(d)
+    elif kind == "hnsw":
+        index = faiss.IndexHNSWFlat(d, params["m"], faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = params["ef_construction"]
+        index.hnsw.efSearch = params["ef_search"]
+    elif kind == "ivfpq":
+        nlist = params["nlist"] or default_nlist(n)
+        quantizer = faiss.IndexFlatIP(d)
+        index = faiss.IndexIVFPQ(
+            quantizer, d, nlist, params["pq_m"], params["nbits"], faiss.METRIC_INNER_PRODUCT
+        )
+        index.train(vectors)
+        index.nprobe = params["nprobe"]
+    else:
+        raise ValueError(f"Unknown index kind: {kind}")
+
+    if ids is not None and kind != "ivfpq":
+        # IVF indexes store ids themselves, the others need an id map
+        index = faiss.IndexIDMap2(index)
+
+    started = time.perf_counter()
+    if ids is None:
+        index.add(vectors)
+    else:
+        index.add_with_ids(vectors, np.asarray(ids, dtype="int64"))
+    logging.info(
+        f"Built {kind} index over {n} vectors in {time.perf_counter() - started:.2f}s"
+    )
+    return index
+
+
+def set_search_param(index, kind, value):
+    if kind == "hnsw":
+        index.hnsw.efSearch = value
+    elif kind == "ivfpq":
+        index.nprobe = value
+
+
+def measure(index, queries, ground_truth, k=10):
+    """Recall against the exact neighbours and per-query latency of `index`"""
+    # Single query searches, as issued by the API
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        index.search(query.reshape(1, -1), k)
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    _, ids = index.search(queries, k)
+    batch_ms = (time.perf_counter() - started) * 1000
+
+    recall_at_1 = np.mean(ids[:, 0] == ground_truth[:, 0])
+    recall_at_k = np.mean(
+        [len(set(found) & set(true)) / k for found, true in zip(ids, ground_truth)]
+    )
+    return {
+        "recall@1": round(float(recall_at_1), 4),
+        f"recall@{k}": round(float(recall_at_k), 4),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+        "batch_ms_per_query": round(batch_ms / len(queries), 4),
+        "index_mb": round(len(faiss.serialize_index(index)) / 1024 / 1024, 1),
+    }
+
+
+def recall_latency_report(vectors, kinds=("hnsw", "ivfpq"), n_queries=1000, k=10, seed=0):
+    """
+    Compare ANN indexes with the exact flat index. A sample of vectors is held
+    out as queries; the rest is indexed.
+    Returns a DataFrame with one row per index kind and search setting.
+    """
+    vectors = normalize_embeddings(vectors)
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(len(vectors))
+    queries = vectors[order[:n_queries]]
+    corpus = vectors[order[n_queries:]]
+
+    flat = build_index(corpus, "flat")
+    _, ground_truth = flat.search(queries, k)
+    rows = [{"kind": "flat", "setting": "-", **measure(flat, queries, ground_truth, k)}]
+
+    for kind in kinds:
+        index = build_index(corpus, kind)
+        for value in REPORT_SWEEP[kind]:
+            set_search_param(index, kind, value)
+            setting = f"efSearch={value}" if kind == "hnsw" else f"nprobe={value}"
+            rows.append(
+                {"kind": kind, "setting": setting, **measure(index, queries, ground_truth, k)}
+            )
+            logging.info(f"{kind} {setting}: {rows[-1]}")
+
+    return pd.DataFrame(rows)
+
+
+def add_source_arguments(parser):
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--from-index", help="Existing flat FAISS index file")
+    source.add_argument("--from-npy", help=".npy file with an (n, d) embedding matrix")
+    source.add_argument(
+        "--from-bigquery",
+        default=GSC_EMBEDDING_TABLE,
+        help="BigQuery table with query and embedding columns (default)",
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Build the GSC query FAISS index.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="Build an index file")
+    add_source_arguments(build_parser)
+    build_parser.add_argument("--kind", choices=list(INDEX_DEFAULTS), default="hnsw")
+    build_parser.add_argument("--output", required=True)
+    build_parser.add_argument("--m", type=int, help="HNSW neighbours per node")
+    build_parser.add_argument("--ef-construction", type=int)
+    build_parser.add_argument("--ef-search", type=int)
+    build_parser.add_argument("--nlist", type=int, help="IVF lists")
+    build_parser.add_argument("--pq-m", type=int, help="PQ sub-quantizers")
+    build_parser.add_argument("--nbits", type=int)
+    build_parser.add_argument("--nprobe", type=int)
+
+    report_parser = subparsers.add_parser(
+        "report", help="Recall vs latency of ANN settings against the flat index"
+    )
+    add_source_arguments(report_parser)
+    report_parser.add_argument("--kinds", default="hnsw,ivfpq")
+    report_parser.add_argument("--queries", type=int, default=1000)
+    report_parser.add_argument("--k", type=int, default=10)
+    report_parser.add_argument("--output", help="Optional CSV file for the report")
+
+    args = parser.parse_args()
+    vectors = load_embeddings(args)
+
+    if args.command == "build":
+        index = build_index(
+            vectors,
+            args.kind,
+            m=args.m,
+            ef_construction=args.ef_construction,
+            ef_search=args.ef_search,
+            nlist=args.nlist,
+            pq_m=args.pq_m,
+            nbits=args.nbits,
+            nprobe=args.nprobe,
+        )
+        faiss.write_index(index, args.output)
+        print(f"Wrote {args.kind} index with {index.ntotal} vectors to {args.output}")
+    else:
+        report = recall_latency_report(
+            vectors, kinds=args.kinds.split(","), n_queries=args.queries, k=args.k
+        )
+        print(report.to_string(index=False))
+        if args.output:
+            report.to_csv(args.output, index=False)
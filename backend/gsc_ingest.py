@@ -0,0 +1,372 @@
+import argparse
+import logging
+import os
+import sqlite3
+import time
+from datetime import date, timedelta
+import faiss
+import numpy as np
+from embedding_cache import normalize_text
+from embedding_service import EmbeddingBatcher
+from gsc_index import build_index, load_gsc_embeddings, normalize_embeddings, GSC_EMBEDDING_TABLE
+from index_registry import IndexRegistry, get_index_registry, FAISS_INDEX_PATH
+
+GSC_SITE_URL = os.getenv("GSC_SITE_URL", "https://www.fishersci.com/")
+GSC_CREDENTIALS_PATH = os.getenv(
+    "GSC_CREDENTIALS_PATH", "thermofigher-gen-ai-5255b69aa6e4.json"
+)
+GSC_INGEST_DB = os.getenv("GSC_INGEST_DB", "gsc_ingest.sqlite")
+GSC_SCOPE = "https://www.googleapis.com/auth/webmasters.readonly"
+# Search Console serves at most 25000 rows per request
+GSC_ROW_LIMIT = 25000
+# Search Console data is final after about three days
+GSC_DATA_DELAY_DAYS = 3
+# Number of new queries embedded and added to the index per step
+INGEST_CHUNK_SIZE = 5000
+
+
+class IngestState:
+    """
+    Progress of the GSC ingestion, kept next to the index.
+
+    `queries` maps every query ever ingested to the id of its vector in the
+    FAISS index; `ranges` records the date ranges already fetched so a run
+    continues where the previous one stopped.
+    """
+
+    def __init__(self, path=GSC_INGEST_DB):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS queries (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                query TEXT UNIQUE NOT NULL,
+                first_seen TEXT,
+                last_seen TEXT,
+                impressions INTEGER NOT NULL DEFAULT 0,
+                indexed INTEGER NOT NULL DEFAULT 0
+            )
+        """
+        )
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS ranges (
+                start_date TEXT PRIMARY KEY,
+                end_date TEXT NOT NULL,
+                rows INTEGER NOT NULL,
+                new_queries INTEGER NOT NULL,
+                ingested_at REAL NOT NULL
+            )
+        """
+        )
+        self.conn.commit()
+
+    def last_ingested_date(self):
+        row = self.conn.execute("SELECT MAX(end_date) FROM ranges").fetchone()
+        return date.fromisoformat(row[0]) if row[0] else None
+
+    def record_range(self, start, end, rows, new_queries):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO ranges VALUES (?, ?, ?, ?, ?)",
+            (start.isoformat(), end.isoformat(), rows, new_queries, time.time()),
+        )
+        self.conn.commit()
+
+    def upsert_queries(self, impressions_by_query, seen):
+        """
+        Add unseen queries (not yet indexed) and refresh the others.
+        Returns: number of queries that were new
+        """
+        before = self.count()
+        seen = seen.isoformat()
+        self.conn.executemany(
+            """
+            INSERT INTO queries (query, first_seen, last_seen, impressions) VALUES (?, ?, ?, ?)
+            ON CONFLICT(query) DO UPDATE SET
+                last_seen = MAX(last_seen, excluded.last_seen),
+                impressions = impressions + excluded.impressions
+        """,
+            [(query, seen, seen, int(n)) for query, n in impressions_by_query.items()],
+        )
+        self.conn.commit()
+        return self.count() - before
+
+    def pending(self, limit, after_id=0):
+        """Returns: [(id, query)] of queries not in the index yet, by id after `after_id`"""
+        return self.conn.execute(
+            "SELECT id, query FROM queries WHERE indexed = 0 AND id > ? ORDER BY id LIMIT ?",
+            (after_id, limit),
+        ).fetchall()
+
+    def mark_indexed(self, ids):
+        self.conn.executemany(
+            "UPDATE queries SET indexed = 1 WHERE id = ?", [(int(i),) for i in ids]
+        )
+        self.conn.commit()
+
+    def active_ids(self, seen_since=None):
+        if seen_since is None:
+            rows = self.conn.execute("SELECT id FROM queries WHERE indexed = 1")
+        else:
+            rows = self.conn.execute(
+                "SELECT id FROM queries WHERE indexed = 1 AND last_seen >= ?",
+                (seen_since.isoformat(),),
+            )
+        return np.array([row[0] for row in rows], dtype="int64")
+
+    def delete(self, ids):
+        self.conn.executemany("DELETE FROM queries WHERE id = ?", [(int(i),) for i in ids])
+        self.conn.commit()
+
+    def count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM queries").fetchone()[0]
+
+
+def build_search_console(credentials_path=GSC_CREDENTIALS_PATH):
+    from google.oauth2 import service_account
+    from googleapiclient.discovery import build
+
+    credentials = service_account.Credentials.from_service_account_file(
+        credentials_path, scopes=[GSC_SCOPE]
+    )
+    return build("searchconsole", "v1", credentials=credentials, cache_discovery=False)
+
+
+def fetch_queries(service, start, end, site_url=GSC_SITE_URL):
+    """
+    All search queries of `site_url` between `start` and `end` (inclusive).
+    Returns: {normalised query: impressions}
+    """
+    impressions = {}
+    start_row = 0
+    while True:
+        request_body = {
+            "startDate": start.isoformat(),
+            "endDate": end.isoformat(),
+            "dimensions": ["QUERY"],
+            "rowLimit": GSC_ROW_LIMIT,
+            "startRow": start_row,
+            "dataState": "final",
+            "searchType": "web",
+        }
+        response = (
+            service.searchanalytics().query(siteUrl=site_url, body=request_body).execute()
+        )
+        rows = response.get("rows", [])
+        for row in rows:
+            query = normalize_text(row["keys"][0])
+            if query:
+                impressions[query] = impressions.get(query, 0) + row["impressions"]
+        start_row += len(rows)
+        logging.info(f"Fetched {start_row} rows for {start} - {end}")
+        if len(rows) < GSC_ROW_LIMIT:
+            return impressions
+
+
+def month_ranges(start, end):
+    """Split [start, end] into calendar-month ranges"""
+    while start <= end:
+        next_month = (start.replace(day=1) + timedelta(days=32)).replace(day=1)
+        yield start, min(end, next_month - timedelta(days=1))
+        start = next_month
+
+
+def read_writable_index(path=FAISS_INDEX_PATH):
+    index = faiss.read_index(path)
+    if not isinstance(index, (faiss.IndexIDMap2, faiss.IndexIVF)):
+        raise ValueError(
+            f"{path} has no id mapping; create it with `python gsc_ingest.py bootstrap`"
+        )
+    return index
+
+
+def indexed_ids(index):
+    if isinstance(index, faiss.IndexIVF):
+        invlists = index.invlists
+        return np.concatenate(
+            [
+                faiss.rev_swig_ptr(invlists.get_ids(i), invlists.list_size(i)).copy()
+                for i in range(index.nlist)
+            ]
+            + [np.empty(0, dtype="int64")]
+        )
+    return faiss.vector_to_array(index.id_map)
+
+
+def publish_index(index, path=FAISS_INDEX_PATH):
+    """Write `index` next to the live file and swap it in for every worker"""
+    new_path = f"{path}.new"
+    faiss.write_index(index, new_path)
+    if not os.path.exists(path):
+        os.replace(new_path, path)
+    elif path == FAISS_INDEX_PATH:
+        get_index_registry().swap(new_path)
+    else:
+        IndexRegistry(path).swap(new_path)
+
+
+_batcher = None
+
+
+def embed_queries(queries):
+    """
+    Embeddings of GSC queries. They bypass the keyword embedding cache, which
+    they would otherwise flood with vectors the pipeline never asks for.
+    """
+    global _batcher
+    if _batcher is None:
+        _batcher = EmbeddingBatcher(cache=None)
+    return _batcher.embed_many(queries)
+
+
+def index_pending(state, index):
+    """
+    Embed every query not in the index yet and append it with its id. The
+    caller marks the queries as indexed once the index has been published,
+    so queries appended by a run that dies before publishing are retried.
+    Returns: (ids of the pending queries, number of vectors added)
+    """
+    # Vectors published by an interrupted run are in the index already
+    present = indexed_ids(index)
+    pending_ids = [np.empty(0, dtype="int64")]
+    added = 0
+    after_id = 0
+    while True:
+        pending = state.pending(INGEST_CHUNK_SIZE, after_id)
+        if not pending:
+            return np.concatenate(pending_ids), added
+        ids = np.array([row[0] for row in pending], dtype="int64")
+        done = np.isin(ids, present)
+        if (~done).any():
+            queries = [query for (_, query), skip in zip(pending, done) if not skip]
+            vectors = normalize_embeddings(np.vstack(embed_queries(queries)))
+            index.add_with_ids(vectors, ids[~done])
+            added += len(queries)
+            logging.info(f"Added {len(queries)} queries to the index ({index.ntotal} total)")
+        pending_ids.append(ids)
+        after_id = int(ids[-1])
+
+
+def update(state, start=None, end=None, site_url=GSC_SITE_URL, path=FAISS_INDEX_PATH):
+    """
+    Fetch the date ranges not ingested yet, month by month, and append unseen
+    queries to the index. Each finished month is recorded, so an interrupted
+    run resumes from the first missing month.
+    """
+    last = state.last_ingested_date()
+    if start is None:
+        if last is None:
+            raise ValueError("No ingested date range yet, pass --start")
+        start = last + timedelta(days=1)
+    end = end or date.today() - timedelta(days=GSC_DATA_DELAY_DAYS)
+    if start > end:
+        print(f"Index is up to date (data ingested through {last})")
+        return
+
+    service = build_search_console()
+    index = read_writable_index(path)
+    for range_start, range_end in month_ranges(start, end):
+        impressions = fetch_queries(service, range_start, range_end, site_url)
+        new_queries = state.upsert_queries(impressions, range_end)
+        ids, added = index_pending(state, index)
+        if added:
+            publish_index(index, path)
+        state.mark_indexed(ids)
+        state.record_range(range_start, range_end, len(impressions), new_queries)
+        print(
+            f"{range_start} - {range_end}: {len(impressions)} queries, "
+            f"{new_queries} new, {added} added to the index"
+        )
+
+
+def bootstrap(state, kind="flat", table=GSC_EMBEDDING_TABLE, through=None, path=FAISS_INDEX_PATH):
+    """
+    Create the id-mapped index and query table from the existing BigQuery
+    embeddings, so later updates only embed queries that are new.
+    """
+    df = load_gsc_embeddings(table)
+    df["query"] = df["query"].map(normalize_text)
+    df = df[df["query"] != ""].drop_duplicates(subset="query")
+    seen = through or date.today()
+    state.upsert_queries(dict.fromkeys(df["query"], 0), seen)
+    ids = state.conn.execute("SELECT query, id FROM queries").fetchall()
+    id_by_query = dict(ids)
+
+    vectors = np.array(df["embedding"].tolist(), dtype="float32")
+    query_ids = df["query"].map(id_by_query).to_numpy(dtype="int64")
+    index = build_index(vectors, kind, ids=query_ids)
+    publish_index(index, path)
+    state.mark_indexed(query_ids)
+    if through:
+        state.record_range(through, through, len(df), len(df))
+    print(f"Bootstrapped {kind} index with {index.ntotal} queries")
+
+
+def compact(state, kind=None, max_age_days=None, path=FAISS_INDEX_PATH):
+    """
+    Rebuild the index from its own vectors: drops queries not seen for
+    `max_age_days`, and retrains / relinks the ANN structure after many appends.
+    kind: index kind of the rebuilt index, the current kind by default
+    """
+    index = read_writable_index(path)
+    seen_since = date.today() - timedelta(days=max_age_days) if max_age_days else None
+    keep = np.intersect1d(state.active_ids(seen_since), indexed_ids(index))
+    stale = np.setdiff1d(state.active_ids(), keep)
+    if not len(keep):
+        raise ValueError("Compaction would leave the index empty")
+
+    if isinstance(index, faiss.IndexIVF):
+        current_kind = "ivfpq"
+    else:
+        inner = faiss.downcast_index(index.index)
+        current_kind = "hnsw" if isinstance(inner, faiss.IndexHNSW) else "flat"
+    if current_kind == "ivfpq":
+        # Lookup by id; vectors are reconstructed from their (lossy) codes
+        index.set_direct_map_type(faiss.DirectMap.Hashtable)
+    vectors = index.reconstruct_batch(keep)
+    new_index = build_index(vectors, kind or current_kind, ids=keep)
+    publish_index(new_index, path)
+    state.delete(stale)
+    print(
+        f"Compacted index: {new_index.ntotal} queries kept, {len(stale)} dropped "
+        f"({current_kind} -> {kind or current_kind})"
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(
+        description="Incrementally ingest Search Console queries into the FAISS index."
+    )
+    parser.add_argument("--state", default=GSC_INGEST_DB)
+    parser.add_argument("--index", default=FAISS_INDEX_PATH)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    bootstrap_parser = subparsers.add_parser(
+        "bootstrap", help="Create the id-mapped index from the BigQuery embeddings"
+    )
+    bootstrap_parser.add_argument("--kind", choices=["flat", "hnsw", "ivfpq"], default="flat")
+    bootstrap_parser.add_argument("--table", default=GSC_EMBEDDING_TABLE)
+    bootstrap_parser.add_argument(
+        "--through", type=date.fromisoformat, help="Last date covered by the table"
+    )
+
+    update_parser = subparsers.add_parser("update", help="Ingest new date ranges")
+    update_parser.add_argument("--start", type=date.fromisoformat)
+    update_parser.add_argument("--end", type=date.fromisoformat)
+    update_parser.add_argument("--site", default=GSC_SITE_URL)
+
+    compact_parser = subparsers.add_parser("compact", help="Rebuild the index")
+    compact_parser.add_argument("--kind", choices=["flat", "hnsw", "ivfpq"])
+    compact_parser.add_argument(
+        "--max-age-days", type=int, help="Drop queries not seen for this many days"
+    )
+
+    args = parser.parse_args()
+    state = IngestState(args.state)
+    if args.command == "bootstrap":
+        bootstrap(state, args.kind, args.table, args.through, args.index)
+    elif args.command == "update":
+        update(state, args.start, args.end, args.site, args.index)
+    else:
+        compact(state, args.kind, args.max_age_days, args.index)
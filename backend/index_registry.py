@@ -0,0 +1,157 @@
+import argparse
+import logging
+import os
+import threading
+import time
+import faiss
+
+FAISS_INDEX_PATH = os.getenv("FAISS_INDEX_PATH", "faiss_TF_index.bin")
+# Seconds between checks of the index file for a newer version
+FAISS_INDEX_CHECK_INTERVAL = float(os.getenv("FAISS_INDEX_CHECK_INTERVAL", "30"))
+
+
+def read_index_mmap(path):
+    """
+    Read a FAISS index with IO_FLAG_MMAP. Only the inverted lists of IVF
+    indexes (e.g. `gsc_index.py build --kind ivfpq`) are actually mapped and
+    shared between worker processes through the page cache; faiss copies the
+    vectors of flat and HNSW indexes into each process's memory regardless.
+    """
+    try:
+        index = faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    except RuntimeError as e:
+        logging.warning(f"Cannot memory-map {path} ({e}), reading it into memory")
+        return faiss.read_index(path)
+    if not isinstance(index, faiss.IndexIVF):
+        logging.warning(
+            f"{path} is not an IVF index, memory-mapping has no effect: every "
+            f"worker process holds its own copy of its vectors"
+        )
+    return index
+
+
+def file_signature(path):
+    stat = os.stat(path)
+    return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+class IndexRegistry:
+    """
+    Lazily loaded, process-wide handle on the GSC query FAISS index.
+
+    The index is loaded on first use. Every `check_interval` seconds the file
+    is stat'ed and, if it was replaced (see `swap`), the new index is loaded
+    and atomically takes over for subsequent searches, without restarting
+    workers.
+    """
+
+    def __init__(self, path=FAISS_INDEX_PATH, check_interval=FAISS_INDEX_CHECK_INTERVAL):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._index = None
+        self._signature = None
+        self._checked_at = 0.0
+
+    def get(self):
+        index = self._index
+        if index is not None and time.monotonic() - self._checked_at < self.check_interval:
+            return index
+
+        with self._lock:
+            if self._index is None or self._changed():
+                self._load()
+            self._checked_at = time.monotonic()
+            return self._index
+
+    def search(self, matrix, k=1):
+        return self.get().search(matrix, k)
+
+    def nearest_similarity(self, matrix):
+        """
+        Cosine similarity of each (normalised) row of `matrix` to its nearest
+        GSC query. Inner-product indexes (see gsc_index.py) return it
+        directly; L2 distances are converted.
+        """
+        index = self.get()
+        distances, _ = index.search(matrix, 1)
+        if index.metric_type == faiss.METRIC_INNER_PRODUCT:
+            return distances[:, 0]
+        return 1 - (distances[:, 0] / 2)
+
+    def reload(self):
+        with self._lock:
+            self._load()
+            self._checked_at = time.monotonic()
+            return self._index
+
+    def swap(self, new_path):
+        """
+        Replace the index file with `new_path` and load it. The new index is
+        checked before it is moved into place; other worker processes pick it
+        up on their next check.
+        """
+        new_index = read_index_mmap(new_path)
+        current = self.get()
+        if new_index.d != current.d:
+            raise ValueError(
+                f"Index dimension mismatch: {new_path} has {new_index.d}, expected {current.d}"
+            )
+        os.replace(new_path, self.path)
+        return self.reload()
+
+    def _changed(self):
+        try:
+            return file_signature(self.path) != self._signature
+        except FileNotFoundError:
+            logging.error(f"FAISS index file {self.path} not found, keeping loaded index")
+            return False
+
+    def _load(self):
+        started = time.perf_counter()
+        signature = file_signature(self.path)
+        self._index = read_index_mmap(self.path)
+        self._signature = signature
+        logging.info(
+            f"Loaded FAISS index {self.path} ({self._index.ntotal} vectors) "
+            f"in {time.perf_counter() - started:.2f}s"
+        )
+
+    def info(self):
+        index = self.get()
+        return {
+            "path": self.path,
+            "vectors": index.ntotal,
+            "dimension": index.d,
+            "metric": "inner_product"
+            if index.metric_type == faiss.METRIC_INNER_PRODUCT
+            else "l2",
+        }
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_index_registry():
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = IndexRegistry()
+        return _registry
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the GSC query FAISS index.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    swap_parser = subparsers.add_parser(
+        "swap", help="Atomically replace the live index file with a new one"
+    )
+    swap_parser.add_argument("new_index")
+    subparsers.add_parser("info", help="Show the live index")
+    args = parser.parse_args()
+
+    registry = get_index_registry()
+    if args.command == "swap":
+        registry.swap(args.new_index)
+    print(registry.info())
@@ -0,0 +1,111 @@
+import os
+import sqlite3
+import threading
+import time
+from cachetools import LRUCache
+from embedding_cache import normalize_text
+
+INTENT_CACHE_PATH = os.getenv("INTENT_CACHE_PATH", "intent_cache.sqlite")
+# Number of intents kept in the in-process LRU layer
+INTENT_CACHE_MEMORY_ITEMS = int(os.getenv("INTENT_CACHE_MEMORY_ITEMS", "100000"))
+
+
+def intent_key(keyword):
+    return normalize_text(keyword).lower()
+
+
+class IntentCache:
+    """
+    Persistent keyword -> intent store per classifier model. The intent of a
+    keyword string doesn't change, so entries never expire; switching the
+    classifier model starts a fresh set.
+    """
+
+    def __init__(self, path=INTENT_CACHE_PATH, memory_items=INTENT_CACHE_MEMORY_ITEMS):
+        self.path = path
+        self._memory = LRUCache(maxsize=memory_items)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS intents (
+                model TEXT NOT NULL,
+                keyword TEXT NOT NULL,
+                intent TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (model, keyword)
+            )
+        """
+        )
+        self._conn.commit()
+        self._counts = {"hits": 0, "misses": 0}
+
+    def get_many(self, model, keywords):
+        """Returns: {keyword: intent} for the keywords found in the cache"""
+        found, missing = {}, {}
+        with self._lock:
+            for keyword in keywords:
+                key = intent_key(keyword)
+                intent = self._memory.get((model, key))
+                if intent is not None:
+                    found[keyword] = intent
+                else:
+                    missing.setdefault(key, []).append(keyword)
+
+            keys = list(missing)
+            # Stay below SQLite's limit on the number of query parameters
+            for start in range(0, len(keys), 500):
+                chunk = keys[start : start + 500]
+                cursor = self._conn.execute(
+                    f"SELECT keyword, intent FROM intents WHERE model = ? AND keyword IN ({','.join('?' * len(chunk))})",
+                    [model, *chunk],
+                )
+                for key, intent in cursor:
+                    self._memory[(model, key)] = intent
+                    for keyword in missing[key]:
+                        found[keyword] = intent
+
+            self._counts["hits"] += len(found)
+            self._counts["misses"] += len(keywords) - len(found)
+        return found
+
+    def put_many(self, model, intents):
+        """Store {keyword: intent} for `model`; None intents are skipped"""
+        now = time.time()
+        rows = [
+            (model, intent_key(keyword), intent, now)
+            for keyword, intent in intents.items()
+            if intent
+        ]
+        with self._lock:
+            for model, key, intent, _ in rows:
+                self._memory[(model, key)] = intent
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO intents (model, keyword, intent, created_at) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM intents").fetchone()[0]
+            counts = dict(self._counts)
+        lookups = counts["hits"] + counts["misses"]
+        return {
+            **counts,
+            "hit_rate": round(counts["hits"] / lookups, 4) if lookups else 0.0,
+            "entries": entries,
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_intent_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = IntentCache()
+        return _cache
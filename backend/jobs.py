@@ -0,0 +1,121 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+
+# Number of pipelines allowed to run at the same time per worker process
+JOB_MAX_WORKERS = int(os.getenv("JOB_MAX_WORKERS", "4"))
+# Seconds a finished job (and its result) is kept before being discarded
+JOB_TTL_SECONDS = int(os.getenv("JOB_TTL_SECONDS", "3600"))
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+
+
+class Job:
+    def __init__(self, url, total_stages):
+        self.id = uuid.uuid4().hex
+        self.url = url
+        self.status = JOB_QUEUED
+        self.stage = None
+        self.stages_completed = []
+        self.total_stages = total_stages
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def finished(self):
+        return self.status in (JOB_COMPLETED, JOB_FAILED)
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "url": self.url,
+            "status": self.status,
+            "stage": self.stage,
+            "stages_completed": list(self.stages_completed),
+            "progress": round(len(self.stages_completed) / self.total_stages, 2),
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobManager:
+    """
+    In-process job queue for long running pipelines.
+
+    Jobs run as asyncio tasks on the application event loop; a semaphore caps
+    how many of them execute concurrently, the rest wait in the queue. Job
+    state lives in memory, so a job can only be polled on the worker process
+    that accepted it.
+    """
+
+    def __init__(self, runner, stages, max_workers=JOB_MAX_WORKERS, ttl=JOB_TTL_SECONDS):
+        self.runner = runner
+        self.stages = stages
+        self.max_workers = max_workers
+        self.ttl = ttl
+        self.jobs = {}
+        self._tasks = {}
+        self._semaphore = None
+
+    def submit(self, url):
+        self._purge_expired()
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_workers)
+        job = Job(url, len(self.stages))
+        self.jobs[job.id] = job
+        task = asyncio.create_task(self._run(job))
+        self._tasks[job.id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job.id, None))
+        logging.info(f"Job {job.id} queued for URL: {url}")
+        return job
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def queue_depth(self):
+        return sum(1 for job in self.jobs.values() if job.status == JOB_QUEUED)
+
+    async def _run(self, job):
+        async with self._semaphore:
+            job.status = JOB_RUNNING
+            job.started_at = time.time()
+
+            def report(stage):
+                job.stage = stage
+                job.stages_completed.append(stage)
+
+            try:
+                job.result = await self.runner(job.url, report=report)
+                job.status = JOB_COMPLETED
+                logging.info(f"Job {job.id} completed for URL: {job.url}")
+            except Exception as e:
+                job.error = str(e)
+                job.status = JOB_FAILED
+                logging.error(f"Job {job.id} failed for URL {job.url}: {e}")
+            finally:
+                job.finished_at = time.time()
+
+    def _purge_expired(self):
+        now = time.time()
+        expired = [
+            job_id
+            for job_id, job in self.jobs.items()
+            if job.finished and now - job.finished_at > self.ttl
+        ]
+        for job_id in expired:
+            del self.jobs[job_id]
+
+    async def shutdown(self):
+        for task in list(self._tasks.values()):
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
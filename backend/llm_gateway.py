@@ -0,0 +1,185 @@
+import asyncio
+import logging
+import os
+import threading
+import httpx
+from openai import OpenAI, AsyncOpenAI
+from dotenv import load_dotenv
+from rate_limiter import get_rate_limiter, estimate_tokens, DEFAULT_COMPLETION_TOKENS
+
+load_dotenv()
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+
+# Seconds to wait for a response; connecting gets a shorter limit
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "120"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "10"))
+# Retries of rate limited, timed out and 5xx requests, with exponential backoff
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+# Size of the shared HTTP connection pool
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "50"))
+# Async requests allowed in flight at once on the event loop
+LLM_MAX_CONCURRENT_REQUESTS = int(os.getenv("LLM_MAX_CONCURRENT_REQUESTS", "32"))
+
+# Model used for each task; override with LLM_MODEL_<TASK>, e.g. LLM_MODEL_SYNONYMS
+MODELS = {
+    "intent": "ft:gpt-4o-mini-2024-07-18:brainlabs:tf-intent-classifier:AH9Zsveq",
+    "intent_batch": "ft:gpt-4o-mini-2024-07-18:brainlabs:tf-intent-classifier:AH9Zsveq",
+    "keywords": "gpt-4o-2024-05-13",
+    "synonyms": "gpt-4o-2024-05-13",
+    "outline_keywords": "gpt-4o-mini-2024-07-18",
+    "topics": "gpt-4o-mini-2024-07-18",
+    "content_optimization": "gpt-4.1",
+    "content_formatting": "gpt-4o-mini-2024-07-18",
+    "embedding": "text-embedding-3-small",
+}
+
+
+def model_for(task):
+    return os.getenv(f"LLM_MODEL_{task.upper()}", MODELS[task])
+
+
+def estimate_chat_tokens(messages, max_tokens=None):
+    return estimate_tokens(
+        [message.get("content") or "" for message in messages],
+        DEFAULT_COMPLETION_TOKENS if max_tokens is None else max_tokens,
+    )
+
+
+class LLMGateway:
+    """
+    Process-wide access to the OpenAI API.
+
+    One sync and one async client are shared by every module and thread, so
+    HTTP keep-alive connections and TLS sessions are reused across calls.
+    Timeouts, retries and the model of each task are configured here, and
+    every request waits for its model's RPM/TPM budget (see rate_limiter.py).
+    """
+
+    def __init__(self, api_key=OPENAI_API_KEY):
+        self.api_key = api_key
+        self._lock = threading.Lock()
+        self._client = None
+        self._async_client = None
+        self._semaphore = None
+        self.limiter = get_rate_limiter()
+        self.usage = {}
+
+    def _options(self):
+        return {
+            "api_key": self.api_key,
+            "timeout": httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+            "max_retries": LLM_MAX_RETRIES,
+        }
+
+    def _limits(self):
+        return httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+        )
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                self._client = OpenAI(
+                    **self._options(), http_client=httpx.Client(limits=self._limits())
+                )
+            return self._client
+
+    @property
+    def async_client(self):
+        with self._lock:
+            if self._async_client is None:
+                self._async_client = AsyncOpenAI(
+                    **self._options(), http_client=httpx.AsyncClient(limits=self._limits())
+                )
+            return self._async_client
+
+    @property
+    def semaphore(self):
+        with self._lock:
+            if self._semaphore is None:
+                self._semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENT_REQUESTS)
+            return self._semaphore
+
+    def _record(self, model, response):
+        usage = getattr(response, "usage", None)
+        tokens = getattr(usage, "total_tokens", None)
+        with self._lock:
+            counts = self.usage.setdefault(model, {"requests": 0, "tokens": 0})
+            counts["requests"] += 1
+            counts["tokens"] += tokens or 0
+        return tokens
+
+    def chat(self, task, messages, **kwargs):
+        model = model_for(task)
+        limiter = self.limiter.for_model(model)
+        estimated = estimate_chat_tokens(messages, kwargs.get("max_tokens"))
+        limiter.acquire(estimated)
+        response = self.client.chat.completions.create(
+            model=model, messages=messages, **kwargs
+        )
+        limiter.settle(estimated, self._record(model, response))
+        return response
+
+    async def achat(self, task, messages, **kwargs):
+        model = model_for(task)
+        limiter = self.limiter.for_model(model)
+        estimated = estimate_chat_tokens(messages, kwargs.get("max_tokens"))
+        await limiter.acquire_async(estimated)
+        async with self.semaphore:
+            response = await self.async_client.chat.completions.create(
+                model=model, messages=messages, **kwargs
+            )
+        limiter.settle(estimated, self._record(model, response))
+        return response
+
+    def embeddings(self, input, model=None):
+        model = model or model_for("embedding")
+        limiter = self.limiter.for_model(model)
+        estimated = estimate_tokens(input)
+        limiter.acquire(estimated)
+        response = self.client.embeddings.create(input=input, model=model)
+        limiter.settle(estimated, self._record(model, response))
+        return response
+
+    def stats(self):
+        with self._lock:
+            usage = {model: dict(counts) for model, counts in self.usage.items()}
+        return {
+            "usage": usage,
+            "queue_depth": self.limiter.queue_depth(),
+            "rate_limits": self.limiter.stats(),
+        }
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.close()
+        if self._client is not None:
+            self._client.close()
+        logging.info("Closed LLM gateway clients")
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway():
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            _gateway = LLMGateway()
+        return _gateway
+
+
+def chat_completion(task, messages, **kwargs):
+    return get_gateway().chat(task, messages, **kwargs)
+
+
+async def async_chat_completion(task, messages, **kwargs):
+    return await get_gateway().achat(task, messages, **kwargs)
+
+
+def llm_stats():
+    return get_gateway().stats()
@@ -1,16 +1,25 @@
+import asyncio
 from fastapi import FastAPI, HTTPException, Depends, Response, Cookie
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm, HTTPBearer
 from google.oauth2 import id_token
 from google.auth.transport import requests
-from pydantic import BaseModel, EmailStr, constr
+from pydantic import BaseModel, EmailStr, constr, TypeAdapter
 from jwt import InvalidTokenError
 from typing import Optional, List, Union, Dict
-from tf_outline_creation import process_row_for_outlines
-from content_creation_tf import optimize_content, extract_optimization_metrics
-from final_content import final_optimize_content
-from serp_metrics import get_metrics_and_ranking, get_difficulty_metrics
-from scraper import scrape_url
+from pipeline import run_pipeline, PIPELINE_STAGES, RESPONSE_SECTIONS
+from jobs import JobManager, JOB_COMPLETED, JOB_FAILED
+from batch import run_batch
+from embedding_service import embedding_stats
+from cluster_store import get_cluster_store
+from llm_gateway import get_gateway, llm_stats
+from intent_cache import get_intent_cache
+from topic_generation import topic_cache_info
+from serp_metrics import close_async_client
+from browser_pool import get_browser_pool
+from scraper import close_http_client, scrape_stats
+from index_registry import get_index_registry
 from database import  init_db, test_db_connection
 from utility import *
 
@@ -219,6 +228,57 @@ async def startup_event():
             print("Application started but database connection failed")
     except Exception as e:
         print(f"Startup error: {str(e)}")
+    try:
+        await get_browser_pool().start()
+    except Exception as e:
+        print(f"Browser pool startup error: {str(e)}")
+
+
+@app.get("/api/stats/embeddings")
+async def get_embedding_stats():
+    """Embedding request counts and cache hit rates of this worker process"""
+    return await asyncio.to_thread(embedding_stats)
+
+
+@app.get("/api/stats/clusters")
+async def get_cluster_stats():
+    """Number of persisted keyword clusters and keywords assigned to them"""
+    return await asyncio.to_thread(get_cluster_store().stats)
+
+
+@app.get("/api/stats/llm")
+async def get_llm_stats():
+    """
+    Requests, tokens and rate limiter queue depth per model of the LLM gateway,
+    and the intent and topic cache hit rates
+    """
+    intent_cache = await asyncio.to_thread(get_intent_cache().stats)
+    return {**llm_stats(), "intent_cache": intent_cache, "topic_cache": topic_cache_info()}
+
+
+@app.get("/api/stats/browser")
+async def get_browser_stats():
+    """Launches, pages served and open pages of the scraper browser pool"""
+    return get_browser_pool().snapshot()
+
+
+@app.get("/api/stats/scraper")
+async def get_scraper_stats():
+    """Per domain: pages scraped from static HTML vs the browser, and fallback reasons"""
+    return scrape_stats()
+
+
+@app.get("/api/index")
+async def get_index_info():
+    """The GSC query index served by this worker process"""
+    return await asyncio.to_thread(get_index_registry().info)
+
+
+@app.post("/api/index/reload")
+async def reload_index():
+    """Load the current index file now instead of on the next periodic check"""
+    await asyncio.to_thread(get_index_registry().reload)
+    return await asyncio.to_thread(get_index_registry().info)
 
 
 class KeywordData(BaseModel):
@@ -316,367 +376,130 @@ class ProcessRowResponse(BaseModel):
     modified_content_metrics: ModifiedContentMetrics
 
 
-@app.post("/process_row")
-async def process_row(request: UrlRequest) -> ProcessRowResponse:
-    url = request.url
-    url_data = await scrape_url(url)
-    row_data = url_data.to_json(orient="records")
-    row_data = json.loads(row_data)
-    row_data = row_data[0]
-    row_data_for_outlines = row_data.copy()
-
-    url_slug = row_data.get("url_slug")
-
-    reference_keywords_obj = {
-        "origin_url": row_data["origin_url"],
-        "url_slug": row_data["url_slug"],
-        "h1-1": {"keywords": [], "priority": 1},
-        "title_tag": {"keywords": [], "priority": 2},
-        "meta_desc": {"keywords": [], "priority": 3},
-        "page_text": {"keywords": [], "priority": 4},
-        "h2_1": {"keywords": [], "priority": 2},
-        "h2_2": {"keywords": [], "priority": 2},
-    }
-
-    if row_data["title"] is not None:
-        reference_keywords_obj["title_tag"]["keywords"] = list(
-            set(row_data["title"].split("|"))
-        )
-        reference_keywords_obj["title_tag_text"] = row_data["title"]
-    reference_keywords_obj["h1-1_text"] = row_data["h1-1"]
-    reference_keywords_obj["h2-1_text"] = row_data["H2-1"]
-    reference_keywords_obj["h2-2_text"] = row_data["H2-2"]
-    reference_keywords_obj["page_text_txt"] = row_data["page_text"]
-
-    # distinct_keywords = reference_keywords_obj['h1']['keywords'] + reference_keywords_obj['h2']['keywords'] + reference_keywords_obj['title_tag']['keywords']
-    distinct_keywords = reference_keywords_obj["title_tag"]["keywords"]
-    logging.debug(f"Distinct keywords received: {distinct_keywords}")
-    processed_data = extract_keywords_row_level(
-        row_data, reference_keywords_obj, distinct_keywords
-    )
-    priority_order = {
-        "h1-1": 1,
-        "title_tag": 2,
-        "h2_2": 3,
-        "h2_1": 5,
-        "page_text": 5,
-        "meta_desc": 4,
-    }
-    flattened_data = []
-    for tag_type, data in processed_data.items():
-        if isinstance(data, dict) and "keywords" in data:
-            for keyword in set(data["keywords"]):
-                flattened_data.append(
-                    {
-                        "keyword": keyword,
-                        "origin_url": processed_data["origin_url"],
-                        "title_tag_text": processed_data["title_tag_text"],
-                        "h1-1_text": processed_data["h1-1_text"],
-                        "h2-1_text": processed_data["h2-1_text"],
-                        "h2-2_text": processed_data["h2-2_text"],
-                        "page_text_txt": processed_data["page_text_txt"],
-                        "url_slug": processed_data["url_slug"],
-                        "tag_type": tag_type,
-                        "priority": data["priority"],
-                        "is_synonym": 0,
-                        "parent_keyword": "parent itself",
-                    }
-                )
-
-    df_flattened = pd.DataFrame(flattened_data)
-    df_flattened["keyword"] = df_flattened["keyword"].str.strip().str.lower()
-    df_flattened["keyword"] = df_flattened["keyword"].str.normalize("NFKC")
-    df_flattened["count"] = df_flattened.groupby("keyword")["keyword"].transform("size")
+class BatchRequest(BaseModel):
+    urls: List[str]
 
-    df_flattened = df_flattened.sort_values(
-        by=["keyword", "tag_type"], ascending=[True, False]
-    )
-    df_flattened = df_flattened.drop_duplicates(subset="keyword", keep="first")
-    df_flattened["count"] = df_flattened["count"].astype(str)
-    df_flattened["tag_priority"] = df_flattened["tag_type"].map(priority_order)
-
-    # Drop duplicates while keeping the first occurrence (which will be 'h1' if available)
-    df_flattened = df_flattened.drop(columns=["tag_priority"])
-    df_synonyms = process_synonym_extraction(df_flattened)
-
-    processed_rows = []
-    df_synonyms["keyword"] = df_synonyms["keyword"].str.strip().str.lower()
-    df_synonyms["keyword"] = df_synonyms["keyword"].str.normalize("NFKC")
-    df_synonyms["count"] = df_synonyms.groupby("keyword")["keyword"].transform("size")
-    df_synonyms["tag_priority"] = df_synonyms["tag_type"].map(priority_order)
-    df_synonyms = df_synonyms.sort_values(by=["keyword", "tag_priority"])
-    df_synonyms = df_synonyms.drop_duplicates(subset="keyword", keep="first")
-    df_synonyms["count"] = df_synonyms["count"].astype(str)
-    df_synonyms = df_synonyms.drop(columns=["tag_priority"])
-    df_synonyms = pd.concat(
-        [df_flattened, df_synonyms.drop_duplicates(subset="keyword", keep="first")],
-        ignore_index=True,
-    )
 
-    df_synonyms = compute_embeddings(df_synonyms)
-    df_synonyms = process_keywords_and_tag_types_concurrently(df_synonyms)
-
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        priority_results = list(
-            executor.map(process_priority, df_synonyms.to_dict("records"))
-        )
-    df_synonyms["priority"] = priority_results
-    df_synonyms = apply_intent_analysis(df_synonyms)
-    df_synonyms_copy = df_synonyms.copy()
-    df_synonyms_copy["priority"] = df_synonyms_copy["priority"].astype("int64")
-    df_synonyms_copy["is_synonym"] = df_synonyms_copy["is_synonym"].astype("bool")
-    df_synonyms_copy["count"] = df_synonyms_copy["count"].astype("int64")
-    df_synonyms_copy["similarity_score"] = df_synonyms_copy["similarity_score"].astype(
-        "float64"
-    )
-    df_synonyms_copy = df_synonyms_copy.rename(
-        columns={
-            "h1-1_text": "h1_1_text",
-            "h2-1_text": "h2_1_text",
-            "h2-2_text": "h2_2_text",
-        }
-    )  # final_synonym
+class JobStatus(BaseModel):
+    job_id: str
+    url: str
+    status: str
+    stage: Optional[str]
+    stages_completed: List[str]
+    progress: float
+    error: Optional[str]
+    created_at: float
+    started_at: Optional[float]
+    finished_at: Optional[float]
 
-    def process_row_v1(row):
-        keyword_metrics, competitor_ranking = get_metrics_and_ranking(
-            row.keyword, row.origin_url
-        )
-        if keyword_metrics:
-            keyword_metrics["intent_classification"] = row.analysed_intent
-            keyword_metrics["tf_url"] = row.origin_url
-        return (keyword_metrics, competitor_ranking)
-
-    def process_outline(row):
-        keyword_metric = {}
-
-        # keyword_metric['intent_classification'] = row.analysed_intent
-        keyword_metric["outline"] = row.keyword
-        keyword_metric["tf_url"] = row.origin_url
-        keyword_metric["url_slug"] = row.url_slug
-        keyword_metric["tag_type"] = row.tag_type
-        keyword_metric["priority"] = row.priority
-        keyword_metric["is_synonym"] = row.is_synonym
-        keyword_metric["parent_keyword"] = row.parent_keyword
-        keyword_metric["count"] = row["count"]
-
-        return keyword_metric
 
-    try:
-        keyword_metrics = []
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            results = executor.map(
-                process_row_v1, [row for _, row in df_synonyms.iterrows()]
-            )
-        competitor_ranking, keyword_metrics = [], []
-        for metrics, rankings in results:
-            if metrics:
-                if metrics["search_volume"] and metrics["search_volume"] > 0:
-                    keyword_metrics.append(metrics)
-            if rankings:
-                competitor_ranking.extend(rankings)
-
-        # Filter out any None or invalid entries
-        competitor_ranking = [
-            r
-            for r in competitor_ranking
-            if isinstance(r, dict)
-            and all(
-                isinstance(r.get(k), (str, int, float))
-                for k in [
-                    "target_url",
-                    "competitor1_url",
-                    "competitor1_rank",
-                    "competitor2_url",
-                    "competitor2_rank",
-                    "competitor3_url",
-                    "competitor3_rank",
-                ]
-            )
-        ]
+job_manager = JobManager(run_pipeline, PIPELINE_STAGES)
 
-        difficulty = get_difficulty_metrics(df_synonyms)
 
-        for i in keyword_metrics:
-            for j in difficulty["keywords"]:
-                if i["keyword"] == j["keyword"]:
-                    i["difficulty"] = j["difficulty"]
-                    i["cpc"] = j["cpc"]
+@app.on_event("shutdown")
+async def shutdown_jobs():
+    await job_manager.shutdown()
+    await get_gateway().aclose()
+    await close_async_client()
+    await get_browser_pool().close()
+    await close_http_client()
 
-        # Extracting keys from keyword_metric
-        keys_to_filter = [item["keyword"] for item in keyword_metrics]
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            results = list(executor.map(get_embedding_if_valid, keys_to_filter))
 
-        # Now results will correspond to    the same order of keys_to_filter
-        embeddings_with_keys = list(zip(keys_to_filter, results))
+@app.post("/process_row")
+async def process_row(request: UrlRequest) -> ProcessRowResponse:
+    output = await run_pipeline(request.url)
+    return ProcessRowResponse(**output)
 
-        # Prepare a list of dictionaries to dump into JSON format
-        embedding_data = [
-            {"keyword": key, "embedding": embedding.tolist()}
-            for key, embedding in embeddings_with_keys
-        ]
-        topic_ai_cluster = clustering(embedding_data)
 
-        new_df = []
-        for i, row in df_synonyms.iterrows():
-            if row.keyword in keys_to_filter:
-                new_df.append(row.to_dict())
-        df_synonyms = pd.DataFrame(new_df)
+@app.post("/jobs", status_code=202)
+async def submit_job(request: UrlRequest) -> JobStatus:
+    job = job_manager.submit(request.url)
+    return JobStatus(**job.to_dict())
 
-        df_synonyms["aggregate_synonyms"] = df_synonyms.apply(
-            lambda row: [row["keyword"], row["priority"], row["tag_type"]], axis=1
-        )
 
-        # # Group by 'url_slug' and create a new DataFrame with aggregated lists
-        aggregated_syn_df = (
-            df_synonyms.groupby("url_slug")
-            .agg({"aggregate_synonyms": lambda x: list(x), "page_text_txt": "first"})
-            .reset_index()
-        )
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str) -> JobStatus:
+    job = job_manager.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return JobStatus(**job.to_dict())
 
-        aggregated_syn_df_bigquery = (
-            df_synonyms.groupby("url_slug")
-            .agg(
-                {
-                    "keyword": lambda x: {
-                        "aggregated_keyword": [
-                            k
-                            for k, t in zip(x, df_synonyms.loc[x.index, "tag_type"])
-                            if not t.endswith("-PAA")
-                        ],
-                        "PAA_Keyword": [
-                            k
-                            for k, t in zip(x, df_synonyms.loc[x.index, "tag_type"])
-                            if t.endswith("-PAA")
-                        ],
-                    },
-                    "page_text_txt": "first",
-                    "h1-1_text": "first",
-                    "h2-1_text": "first",
-                    "h2-2_text": "first",
-                }
-            )
-            .reset_index()
-        )
 
-        # Split `keyword` column dictionary into two separate columns
-        aggregated_syn_df_bigquery[["aggregated_keyword", "PAA_Keyword"]] = (
-            pd.DataFrame(
-                aggregated_syn_df_bigquery["keyword"].tolist(),
-                index=aggregated_syn_df_bigquery.index,
-            )
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str) -> ProcessRowResponse:
+    job = job_manager.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.status == JOB_FAILED:
+        raise HTTPException(status_code=500, detail=f"Job failed: {job.error}")
+    if job.status != JOB_COMPLETED:
+        raise HTTPException(
+            status_code=409, detail=f"Job is not finished yet (status: {job.status})"
         )
+    return ProcessRowResponse(**job.result)
 
-        # Drop the original 'keyword' column as it has been split into two
-        aggregated_syn_df_bigquery.drop(columns=["keyword"], inplace=True)
 
-        aggregated_syn_df_bigquery = aggregated_syn_df_bigquery.rename(
-            columns={"page_text_txt": "page_context"}
-        )
+@app.post("/process_batch")
+async def process_batch(request: BatchRequest):
+    """
+    Process many URLs together and stream one JSON line per URL
+    (url, status and result or error) as each page finishes.
+    """
 
-        aggregated_syn_df_bigquery["aggregated_keyword"] = aggregated_syn_df_bigquery[
-            "aggregated_keyword"
-        ].astype("str")
-        aggregated_syn_df_bigquery["PAA_Keyword"] = aggregated_syn_df_bigquery[
-            "PAA_Keyword"
-        ].astype("str")
-    except Exception as e:
-        logging.error(f"Error in similarity: {e}")
-        print(f"Error in similarity score: {e}")
+    async def stream():
+        async for item in run_batch(request.urls):
+            if item["status"] == "completed":
+                item["result"] = ProcessRowResponse(**item["result"]).model_dump()
+            yield json.dumps(item, default=str) + "\n"
 
-    outlines_df = process_row_for_outlines(row_data_for_outlines)
-    outlines_df = outlines_df.astype(str)
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
 
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        results = executor.map(
-            process_outline, [row for _, row in outlines_df.iterrows()]
-        )
 
-    content_summary_metrics = [result for result in results if result is not None]
-    outlines_df["aggregate_outlines"] = outlines_df.apply(
-        lambda row: [row["keyword"], row["priority"], row["tag_type"]], axis=1
-    )
+def format_sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
 
-    # # Group by 'url_slug' and create a new DataFrame with aggregated lists
-    aggregated_df = (
-        outlines_df.groupby("url_slug")
-        .agg({"aggregate_outlines": lambda x: list(x)})
-        .reset_index()
-    )
 
-    if "aggregated_syn_df" not in locals() or aggregated_syn_df.empty:
-        aggregated_syn_df = pd.DataFrame(columns=["url_slug"])
-    agg_syn_outlines = pd.merge(
-        aggregated_syn_df, aggregated_df, on="url_slug", how="inner"
-    )
+@app.get("/process_row/stream")
+async def process_row_stream(url: str):
+    """
+    Server-Sent Events variant of /process_row. Every section of
+    ProcessRowResponse is sent as its own event (named after the field) the
+    moment its stage completes, interleaved with `progress` events, and
+    followed by a final `done` or `error` event.
+    """
+    queue = asyncio.Queue()
 
-    #     # creating new df for aggregated syn outline df
-    aggregated_outline_df_bigquery = (
-        outlines_df.groupby("url_slug")
-        .agg({"keyword": lambda x: list(x)})
-        .reset_index()
-    )
-    try:
+    def on_section(section, value):
+        adapter = TypeAdapter(ProcessRowResponse.model_fields[section].annotation)
+        value = adapter.dump_python(adapter.validate_python(value), mode="json")
+        queue.put_nowait((section, value))
 
-        aggregated_outline_syn_df_bigquery = pd.merge(
-            aggregated_syn_df_bigquery,
-            aggregated_outline_df_bigquery,
-            on="url_slug",
-            how="inner",
-        )
-        aggregated_outline_syn_df_bigquery = aggregated_outline_syn_df_bigquery.rename(
-            columns={"keyword": "aggregate_outlines"}
-        )
-        aggregated_outline_syn_df_bigquery["aggregate_outlines"] = (
-            aggregated_outline_syn_df_bigquery["aggregate_outlines"].astype("str")
-        )
-    except Exception as e:
-        logging.error(f"Error in aggregated_outline_syn_df_bigquery: {e}")
-
-    optimize_content_df = optimize_content(agg_syn_outlines)
-    final_content_df = final_optimize_content(optimize_content_df)
-    extract_optimization_metrics_df = extract_optimization_metrics(optimize_content_df)
-    extract_optimization_metrics_df.to_csv("optimize_content_df.csv")
-    extract_optimization_metrics_df = extract_optimization_metrics_df.dropna(how="any")
-    extract_optimization_metrics_df.dropna(inplace=True)
-    extract_optimization_metrics_df = extract_optimization_metrics_df.astype(str)
-
-    extract_optimization_metrics_df.dropna(inplace=True)
-    extract_optimization_metrics_df["keywords_incorporated"] = (
-        extract_optimization_metrics_df["keywords_incorporated"].apply(
-            lambda x: x.strip("[]")
-        )
-    )
-    extract_optimization_metrics_df["outlines_incorporated"] = (
-        extract_optimization_metrics_df["outlines_incorporated"].apply(
-            lambda x: x.strip("[]")
+    def report(stage):
+        queue.put_nowait(
+            ("progress", {"stage": stage, "total_stages": len(PIPELINE_STAGES)})
         )
-    )
-
-    def convert_numeric_keys_to_strings(data):
-        if isinstance(data, dict):
-            return {str(k): convert_numeric_keys_to_strings(v) for k, v in data.items()}
-        elif isinstance(data, list):
-            return [convert_numeric_keys_to_strings(item) for item in data]
-        return data
-
-    # Before returning the response, convert the keys
-    output = {
-        "keyword_metrics": keyword_metrics,
-        "topic_ai_cluster": convert_numeric_keys_to_strings(topic_ai_cluster),
-        "content_summary": content_summary_metrics,
-        "modified_content": final_content_df["modified_content_v1"][0],
-        "modified_content_metrics": convert_numeric_keys_to_strings(
-            extract_optimization_metrics_df.to_dict()
-        ),
-        "competitor_ranking": competitor_ranking,
-    }
 
-    return ProcessRowResponse(
-        keyword_metrics=output["keyword_metrics"],
-        topic_ai_cluster=output["topic_ai_cluster"],
-        content_summary=output["content_summary"],
-        competitor_ranking=output["competitor_ranking"],
-        modified_content=output["modified_content"],
-        modified_content_metrics=output["modified_content_metrics"],
+    async def run():
+        try:
+            await run_pipeline(url, report=report, on_section=on_section)
+            queue.put_nowait(("done", {"sections": RESPONSE_SECTIONS}))
+        except Exception as e:
+            logging.error(f"Streaming pipeline failed for URL {url}: {e}")
+            queue.put_nowait(("error", {"detail": str(e)}))
+
+    async def stream():
+        task = asyncio.create_task(run())
+        try:
+            while True:
+                event, data = await queue.get()
+                yield format_sse(event, data)
+                if event in ("done", "error"):
+                    break
+        finally:
+            task.cancel()
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
@@ -0,0 +1,412 @@
+import asyncio
+import json
+import logging
+import pandas as pd
+from tf_outline_creation import process_row_for_outlines
+from content_creation_tf import optimize_content, extract_optimization_metrics
+from final_content import final_optimize_content
+from serp_metrics import process_serp_data
+from scraper import scrape_url
+from dag import Stage, run_dag
+from shared_work import SharedWork
+from utility import (
+    extract_keywords_row_level,
+    process_synonym_extraction_async,
+    compute_embeddings,
+    process_keywords_and_tag_types_concurrently,
+    update_priorities,
+    clustering,
+)
+
+PRIORITY_ORDER = {
+    "h1-1": 1,
+    "title_tag": 2,
+    "h2_2": 3,
+    "h2_1": 5,
+    "page_text": 5,
+    "meta_desc": 4,
+}
+
+COMPETITOR_RANKING_FIELDS = [
+    "target_url",
+    "competitor1_url",
+    "competitor1_rank",
+    "competitor2_url",
+    "competitor2_rank",
+    "competitor3_url",
+    "competitor3_rank",
+]
+
+
+def build_reference_keywords(row_data):
+    reference_keywords_obj = {
+        "origin_url": row_data["origin_url"],
+        "url_slug": row_data["url_slug"],
+        "h1-1": {"keywords": [], "priority": 1},
+        "title_tag": {"keywords": [], "priority": 2},
+        "meta_desc": {"keywords": [], "priority": 3},
+        "page_text": {"keywords": [], "priority": 4},
+        "h2_1": {"keywords": [], "priority": 2},
+        "h2_2": {"keywords": [], "priority": 2},
+    }
+
+    if row_data["title"] is not None:
+        reference_keywords_obj["title_tag"]["keywords"] = list(
+            set(row_data["title"].split("|"))
+        )
+        reference_keywords_obj["title_tag_text"] = row_data["title"]
+    reference_keywords_obj["h1-1_text"] = row_data["h1-1"]
+    reference_keywords_obj["h2-1_text"] = row_data["H2-1"]
+    reference_keywords_obj["h2-2_text"] = row_data["H2-2"]
+    reference_keywords_obj["page_text_txt"] = row_data["page_copy"]
+    reference_keywords_obj["page_text_prompt"] = row_data["page_text"]
+    return reference_keywords_obj
+
+
+def extract_row_keywords(row_data):
+    """
+    Extract the keywords of every tag of a scraped row into a flat DataFrame.
+    """
+    reference_keywords_obj = build_reference_keywords(row_data)
+    distinct_keywords = reference_keywords_obj["title_tag"]["keywords"]
+    logging.debug(f"Distinct keywords received: {distinct_keywords}")
+    processed_data = extract_keywords_row_level(
+        row_data, reference_keywords_obj, distinct_keywords
+    )
+
+    flattened_data = []
+    for tag_type, data in processed_data.items():
+        if isinstance(data, dict) and "keywords" in data:
+            for keyword in set(data["keywords"]):
+                flattened_data.append(
+                    {
+                        "keyword": keyword,
+                        "origin_url": processed_data["origin_url"],
+                        "title_tag_text": processed_data["title_tag_text"],
+                        "h1-1_text": processed_data["h1-1_text"],
+                        "h2-1_text": processed_data["h2-1_text"],
+                        "h2-2_text": processed_data["h2-2_text"],
+                        "page_text_txt": processed_data["page_text_txt"],
+                        "page_text_prompt": processed_data["page_text_prompt"],
+                        "url_slug": processed_data["url_slug"],
+                        "tag_type": tag_type,
+                        "priority": data["priority"],
+                        "is_synonym": 0,
+                        "parent_keyword": "parent itself",
+                    }
+                )
+
+    df_flattened = pd.DataFrame(flattened_data)
+    df_flattened["keyword"] = df_flattened["keyword"].str.strip().str.lower()
+    df_flattened["keyword"] = df_flattened["keyword"].str.normalize("NFKC")
+    df_flattened["count"] = df_flattened.groupby("keyword")["keyword"].transform("size")
+
+    # Keep the first occurrence of every keyword
+    df_flattened = df_flattened.sort_values(
+        by=["keyword", "tag_type"], ascending=[True, False]
+    )
+    df_flattened = df_flattened.drop_duplicates(subset="keyword", keep="first")
+    df_flattened["count"] = df_flattened["count"].astype(str)
+    return df_flattened
+
+
+async def expand_synonyms(df_flattened):
+    """
+    Add the synonyms of every extracted keyword, keeping one row per keyword.
+    """
+    df_synonyms = await process_synonym_extraction_async(df_flattened)
+
+    df_synonyms["keyword"] = df_synonyms["keyword"].str.strip().str.lower()
+    df_synonyms["keyword"] = df_synonyms["keyword"].str.normalize("NFKC")
+    df_synonyms["count"] = df_synonyms.groupby("keyword")["keyword"].transform("size")
+    df_synonyms["tag_priority"] = df_synonyms["tag_type"].map(PRIORITY_ORDER)
+    df_synonyms = df_synonyms.sort_values(by=["keyword", "tag_priority"])
+    df_synonyms = df_synonyms.drop_duplicates(subset="keyword", keep="first")
+    df_synonyms["count"] = df_synonyms["count"].astype(str)
+    df_synonyms = df_synonyms.drop(columns=["tag_priority"])
+    return pd.concat(
+        [df_flattened, df_synonyms.drop_duplicates(subset="keyword", keep="first")],
+        ignore_index=True,
+    )
+
+
+def score_keywords(df_keywords, shared):
+    """
+    Score every keyword for page similarity, PAA tag type and GSC priority.
+    """
+    df_scored = compute_embeddings(df_keywords.copy(), embed_many=shared.embeddings)
+    df_scored = process_keywords_and_tag_types_concurrently(df_scored)
+    df_scored["priority"] = update_priorities(df_scored)
+    return df_scored
+
+
+async def classify_intents(df_keywords, shared):
+    """Returns: {keyword: analysed_intent}"""
+    keywords = list(df_keywords["keyword"])
+    return dict(zip(keywords, await shared.intents_async(keywords)))
+
+
+async def get_keyword_serp_metrics(row, shared):
+    serp_data = await shared.serp_data_async(row.keyword)
+    if not serp_data:
+        return None, None
+
+    keyword_metrics, competitor_ranking = process_serp_data(
+        serp_data, row.keyword, row.origin_url
+    )
+    if keyword_metrics:
+        keyword_metrics["tf_url"] = row.origin_url
+    return (keyword_metrics, competitor_ranking)
+
+
+async def fetch_serp_metrics(df_keywords, shared):
+    """Returns: [(keyword_metrics, competitor_ranking)] per keyword"""
+    return await asyncio.gather(
+        *[get_keyword_serp_metrics(row, shared) for row in df_keywords.itertuples()]
+    )
+
+
+async def fetch_difficulty_metrics(df_keywords, shared):
+    return await shared.difficulty_async(df_keywords.keyword.to_list())
+
+
+def build_competitor_ranking(serp_results):
+    competitor_ranking = []
+    for _, rankings in serp_results:
+        if rankings:
+            competitor_ranking.extend(rankings)
+
+    # Filter out any None or invalid entries
+    return [
+        r
+        for r in competitor_ranking
+        if isinstance(r, dict)
+        and all(
+            isinstance(r.get(k), (str, int, float)) for k in COMPETITOR_RANKING_FIELDS
+        )
+    ]
+
+
+def build_keyword_metrics(serp_results, intents, difficulty):
+    """
+    Merge SERP metrics, intent and difficulty of the keywords with search volume.
+    """
+    keyword_metrics = []
+    for metrics, _ in serp_results:
+        if metrics and metrics["search_volume"] and metrics["search_volume"] > 0:
+            metrics = dict(metrics)
+            metrics["intent_classification"] = intents.get(metrics["keyword"])
+            keyword_metrics.append(metrics)
+
+    for i in keyword_metrics:
+        for j in difficulty["keywords"]:
+            if i["keyword"] == j["keyword"]:
+                i["difficulty"] = j["difficulty"]
+                i["cpc"] = j["cpc"]
+
+    return keyword_metrics
+
+
+def get_keyword_vectors(keywords, df_scored, shared):
+    """
+    Embeddings of `keywords`, reusing the vectors computed while scoring and
+    embedding only keywords that were not scored.
+    """
+    known = {
+        keyword: embedding
+        for keyword, embedding in zip(df_scored["keyword"], df_scored["keyword_embedding"])
+        if embedding is not None
+    }
+    missing = [keyword for keyword in keywords if keyword not in known]
+    if missing:
+        known.update(zip(missing, shared.embeddings(missing)))
+    return [known[keyword] for keyword in keywords]
+
+
+def cluster_keyword_topics(keyword_metrics, df_scored, shared):
+    keys_to_filter = [item["keyword"] for item in keyword_metrics]
+    results = get_keyword_vectors(keys_to_filter, df_scored, shared)
+
+    embedding_data = [
+        {"keyword": key, "embedding": embedding.tolist()}
+        for key, embedding in zip(keys_to_filter, results)
+    ]
+    return convert_numeric_keys_to_strings(clustering(embedding_data))
+
+
+def aggregate_keywords(df_scored, keyword_metrics):
+    """
+    Group the keywords with search volume into one
+    [keyword, priority, tag_type] list per url_slug.
+    """
+    try:
+        keys_to_filter = {item["keyword"] for item in keyword_metrics}
+        df_scored = df_scored[df_scored["keyword"].isin(keys_to_filter)].copy()
+        if df_scored.empty:
+            return pd.DataFrame(columns=["url_slug"])
+
+        df_scored["aggregate_synonyms"] = df_scored.apply(
+            lambda row: [row["keyword"], row["priority"], row["tag_type"]], axis=1
+        )
+        return (
+            df_scored.groupby("url_slug")
+            .agg({"aggregate_synonyms": lambda x: list(x), "page_text_txt": "first"})
+            .reset_index()
+        )
+    except Exception as e:
+        logging.error(f"Error aggregating keywords: {e}")
+        return pd.DataFrame(columns=["url_slug"])
+
+
+def process_outline(row):
+    return {
+        "outline": row.keyword,
+        "tf_url": row.origin_url,
+        "url_slug": row.url_slug,
+        "tag_type": row.tag_type,
+        "priority": row.priority,
+        "is_synonym": row.is_synonym,
+        "parent_keyword": row.parent_keyword,
+        "count": row["count"],
+    }
+
+
+def generate_outlines(row_data):
+    outlines_df = process_row_for_outlines(row_data.copy())
+    return outlines_df.astype(str)
+
+
+def build_content_summary(outlines_df):
+    return [process_outline(row) for _, row in outlines_df.iterrows()]
+
+
+def aggregate_outlines(outlines_df):
+    """
+    Group the outlines into one [outline, priority, tag_type] list per url_slug.
+    """
+    outlines_df = outlines_df.copy()
+    outlines_df["aggregate_outlines"] = outlines_df.apply(
+        lambda row: [row["keyword"], row["priority"], row["tag_type"]], axis=1
+    )
+    return (
+        outlines_df.groupby("url_slug")
+        .agg({"aggregate_outlines": lambda x: list(x)})
+        .reset_index()
+    )
+
+
+def optimize_page_content(aggregated_syn_df, outlines_df):
+    """
+    Rewrite the page content with the aggregated keywords and outlines.
+    """
+    agg_syn_outlines = pd.merge(
+        aggregated_syn_df, aggregate_outlines(outlines_df), on="url_slug", how="inner"
+    )
+    return optimize_content(agg_syn_outlines)
+
+
+def finalize_page_content(optimize_content_df):
+    final_content_df = final_optimize_content(optimize_content_df.copy())
+    return final_content_df["modified_content_v1"][0]
+
+
+def build_optimization_metrics(optimize_content_df):
+    extract_optimization_metrics_df = extract_optimization_metrics(
+        optimize_content_df.copy()
+    )
+    extract_optimization_metrics_df.to_csv("optimize_content_df.csv")
+    extract_optimization_metrics_df = extract_optimization_metrics_df.dropna(how="any")
+    extract_optimization_metrics_df = extract_optimization_metrics_df.astype(str)
+
+    extract_optimization_metrics_df["keywords_incorporated"] = (
+        extract_optimization_metrics_df["keywords_incorporated"].apply(
+            lambda x: x.strip("[]")
+        )
+    )
+    extract_optimization_metrics_df["outlines_incorporated"] = (
+        extract_optimization_metrics_df["outlines_incorporated"].apply(
+            lambda x: x.strip("[]")
+        )
+    )
+    return convert_numeric_keys_to_strings(extract_optimization_metrics_df.to_dict())
+
+
+def convert_numeric_keys_to_strings(data):
+    if isinstance(data, dict):
+        return {str(k): convert_numeric_keys_to_strings(v) for k, v in data.items()}
+    elif isinstance(data, list):
+        return [convert_numeric_keys_to_strings(item) for item in data]
+    return data
+
+
+async def scrape_row(url, shared):
+    url_data = await scrape_url(url)
+    return json.loads(url_data.to_json(orient="records"))[0]
+
+
+PIPELINE = [
+    Stage("scrape", scrape_row, ["url", "shared"]),
+    Stage("keyword_extraction", extract_row_keywords, ["scrape"]),
+    Stage("synonyms", expand_synonyms, ["keyword_extraction"]),
+    Stage("scoring", score_keywords, ["synonyms", "shared"]),
+    Stage("intents", classify_intents, ["synonyms", "shared"]),
+    Stage("serp", fetch_serp_metrics, ["synonyms", "shared"]),
+    Stage("difficulty", fetch_difficulty_metrics, ["synonyms", "shared"]),
+    Stage("competitor_ranking", build_competitor_ranking, ["serp"]),
+    Stage("keyword_metrics", build_keyword_metrics, ["serp", "intents", "difficulty"]),
+    Stage(
+        "topic_ai_cluster",
+        cluster_keyword_topics,
+        ["keyword_metrics", "scoring", "shared"],
+    ),
+    Stage("aggregated_keywords", aggregate_keywords, ["scoring", "keyword_metrics"]),
+    Stage("outlines", generate_outlines, ["scrape"]),
+    Stage("content_summary", build_content_summary, ["outlines"]),
+    Stage("optimized_content", optimize_page_content, ["aggregated_keywords", "outlines"]),
+    Stage("modified_content", finalize_page_content, ["optimized_content"]),
+    Stage(
+        "modified_content_metrics", build_optimization_metrics, ["optimized_content"]
+    ),
+]
+
+# Stage names reported to the progress callback
+PIPELINE_STAGES = [stage.name for stage in PIPELINE]
+
+RESPONSE_SECTIONS = [
+    "keyword_metrics",
+    "topic_ai_cluster",
+    "content_summary",
+    "competitor_ranking",
+    "modified_content",
+    "modified_content_metrics",
+]
+
+
+async def run_pipeline(url, report=None, shared=None, on_section=None):
+    """
+    Run the full /process_row pipeline for a single URL.
+
+    Stages are scheduled by their declared inputs, so independent branches
+    (outline generation, SERP lookups, intent analysis, ...) run concurrently.
+    `report`, if given, is called with the name of every stage in
+    PIPELINE_STAGES as it completes. `shared` is a SharedWork memo for API
+    results; pass the same one to every page of a batch so work is reused
+    across pages. `on_section(section, value)` is called as soon as each
+    section of RESPONSE_SECTIONS is ready.
+
+    Returns a dict with the fields of ProcessRowResponse.
+    """
+
+    def stage_done(stage, result):
+        logging.info(f"[{url}] stage '{stage}' completed")
+        if report is not None:
+            report(stage)
+        if on_section is not None and stage in RESPONSE_SECTIONS:
+            on_section(stage, result)
+
+    results = await run_dag(
+        PIPELINE,
+        initial={"url": url, "shared": shared or SharedWork()},
+        on_complete=stage_done,
+    )
+    return {section: results[section] for section in RESPONSE_SECTIONS}
@@ -1,3 +1,5 @@
+import json
+
 system_message = """# SEO Query Intent Classifier
 
 You are an AI assistant specialized in classifying search queries based on their intent. Given a search query, your task is to determine the most likely intent category from the following options:
@@ -56,6 +58,18 @@ Response: Transactional
 
 Remember, your response should ONLY be the intent category name, nothing else, no other text."""
 
+def generate_batch_intent_prompt(keywords):
+    queries = "\n".join(f"{i}. {json.dumps(keyword)}" for i, keyword in enumerate(keywords, 1))
+    PROMPT = f"""Classify each of the following {len(keywords)} queries separately, following the rules above for every query.
+
+                Queries:
+                {queries}
+
+                Respond with a JSON object of the form {{"intents": ["<intent of query 1>", "<intent of query 2>", ...]}} holding exactly {len(keywords)} entries, in the same order as the queries. Each entry is only the intent category name, or several separated by a pipe (|). No other text.
+             """
+    return PROMPT
+
+
 def generate_synonym_prompt(keyword, pg_txt):
     PROMPT = f"""Role: You are an SEO expert specializing in semantic keyword research and synonym generation.
 
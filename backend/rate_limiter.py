@@ -0,0 +1,176 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+
+# Requests and tokens per minute allowed per model unless LLM_RATE_LIMITS overrides
+LLM_DEFAULT_RPM = int(os.getenv("LLM_DEFAULT_RPM", "500"))
+LLM_DEFAULT_TPM = int(os.getenv("LLM_DEFAULT_TPM", "200000"))
+# Per-model limits, e.g. {"gpt-4o-2024-05-13": {"rpm": 500, "tpm": 30000}}
+LLM_RATE_LIMITS = json.loads(os.getenv("LLM_RATE_LIMITS", "{}"))
+# Completion tokens assumed for requests without max_tokens
+DEFAULT_COMPLETION_TOKENS = 1000
+
+
+def estimate_tokens(texts, max_tokens=None):
+    """Rough token count of a request: ~4 characters per token plus the completion"""
+    prompt_tokens = sum(len(text) for text in texts) // 4 + 1
+    return prompt_tokens + (max_tokens if max_tokens is not None else 0)
+
+
+class TokenBucket:
+    """Holds up to `capacity` units, refilled continuously at capacity per minute"""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.available = float(per_minute)
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.available = min(
+            self.capacity, self.available + (now - self.updated) * self.rate
+        )
+        self.updated = now
+
+    def wait_time(self, amount):
+        """Seconds until `amount` units are available"""
+        return max(0.0, (amount - self.available) / self.rate)
+
+
+class ModelRateLimiter:
+    """
+    Meters requests and estimated tokens of one model against its RPM and TPM
+    limits. Callers wait for capacity instead of being sent to the API and
+    failing with 429s; estimates are corrected once the real usage is known.
+    """
+
+    def __init__(self, rpm, tpm):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self._lock = threading.Lock()
+        self._condition = threading.Condition(self._lock)
+        self.waiting = 0
+        self.stats = {"requests": 0, "waited": 0, "wait_seconds": 0.0}
+
+    def _try_acquire(self, tokens):
+        """Take capacity if available. Returns: 0 on success, else seconds to wait"""
+        now = time.monotonic()
+        self.requests.refill(now)
+        self.tokens.refill(now)
+        # A request larger than the whole bucket waits for a full bucket
+        tokens = min(tokens, self.tokens.capacity)
+        wait = max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+        if wait == 0:
+            self.requests.available -= 1
+            self.tokens.available -= tokens
+            self.stats["requests"] += 1
+        return wait
+
+    def _record_wait(self, started):
+        waited = time.monotonic() - started
+        if waited > 0.001:
+            self.stats["waited"] += 1
+            self.stats["wait_seconds"] += waited
+
+    def acquire(self, tokens):
+        started = time.monotonic()
+        with self._condition:
+            self.waiting += 1
+            try:
+                while True:
+                    wait = self._try_acquire(tokens)
+                    if wait == 0:
+                        break
+                    self._condition.wait(wait)
+            finally:
+                self.waiting -= 1
+            self._record_wait(started)
+
+    async def acquire_async(self, tokens):
+        started = time.monotonic()
+        with self._lock:
+            self.waiting += 1
+        try:
+            while True:
+                with self._lock:
+                    wait = self._try_acquire(tokens)
+                if wait == 0:
+                    break
+                await asyncio.sleep(wait)
+        finally:
+            with self._lock:
+                self.waiting -= 1
+                self._record_wait(started)
+
+    def settle(self, estimated, actual):
+        """Give back (or charge) the difference between estimated and actual tokens"""
+        if actual is None:
+            return
+        with self._condition:
+            self.tokens.available = min(
+                self.tokens.capacity, self.tokens.available + estimated - actual
+            )
+            self._condition.notify_all()
+
+    def snapshot(self):
+        with self._lock:
+            now = time.monotonic()
+            self.requests.refill(now)
+            self.tokens.refill(now)
+            return {
+                "queue_depth": self.waiting,
+                "rpm": int(self.requests.capacity),
+                "tpm": int(self.tokens.capacity),
+                "available_requests": int(self.requests.available),
+                "available_tokens": int(self.tokens.available),
+                **self.stats,
+                "wait_seconds": round(self.stats["wait_seconds"], 3),
+            }
+
+
+class RateLimiter:
+    """Process-wide registry of per-model limiters"""
+
+    def __init__(self, limits=LLM_RATE_LIMITS):
+        self.limits = limits
+        self._lock = threading.Lock()
+        self._models = {}
+
+    def for_model(self, model):
+        with self._lock:
+            limiter = self._models.get(model)
+            if limiter is None:
+                config = self.limits.get(model, {})
+                limiter = ModelRateLimiter(
+                    config.get("rpm", LLM_DEFAULT_RPM), config.get("tpm", LLM_DEFAULT_TPM)
+                )
+                self._models[model] = limiter
+                logging.info(
+                    f"Rate limiting {model} to {int(limiter.requests.capacity)} RPM, "
+                    f"{int(limiter.tokens.capacity)} TPM"
+                )
+            return limiter
+
+    def queue_depth(self):
+        with self._lock:
+            return sum(limiter.waiting for limiter in self._models.values())
+
+    def stats(self):
+        with self._lock:
+            models = dict(self._models)
+        return {model: limiter.snapshot() for model, limiter in models.items()}
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = RateLimiter()
+        return _limiter
@@ -1,14 +1,17 @@
+import asyncio
+import httpx
 import pandas as pd
-import time
 import logging
+import itertools
 import json
-from playwright.async_api import (
-    async_playwright,
-    TimeoutError as PlaywrightTimeoutError,
-)
+import threading
+import time
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
 from bs4 import BeautifulSoup
+from bs4.element import CData, NavigableString, Tag
 import os
 from urllib.parse import urlparse
+from browser_pool import get_browser_pool
 
 # Setup logger
 os.makedirs("logs", exist_ok=True)
@@ -28,6 +31,54 @@ console_handler.setFormatter(
 )
 logging.getLogger().addHandler(console_handler)
 
+# Upper bound on the page text sent to LLM prompts (~4 characters per token)
+PAGE_TEXT_MAX_CHARS = int(os.getenv("PAGE_TEXT_MAX_CHARS", "8000"))
+# Seconds to wait, after the load event, for the product copy to render and for
+# the network to go quiet; both waits run together and end as soon as they hold
+SCRAPE_CONTENT_TIMEOUT = float(os.getenv("SCRAPE_CONTENT_TIMEOUT", "4"))
+SCRAPE_NETWORK_IDLE_TIMEOUT = float(os.getenv("SCRAPE_NETWORK_IDLE_TIMEOUT", "4"))
+# Elements whose presence means the PDP heading and description have rendered
+SCRAPE_READY_SELECTOR = os.getenv(
+    "SCRAPE_READY_SELECTOR",
+    "h1, [class*='description'], [id*='description']",
+)
+
+def env_list(name, default):
+    return [item.strip() for item in os.getenv(name, default).split(",") if item.strip()]
+
+
+# Fast mode aborts requests the scraper doesn't need: only the DOM text is read,
+# so images, fonts, media and analytics/ad tags are never fetched
+SCRAPE_FAST_MODE = os.getenv("SCRAPE_FAST_MODE", "true").lower() == "true"
+# Playwright resource types aborted in fast mode
+SCRAPE_BLOCKED_RESOURCE_TYPES = set(
+    env_list("SCRAPE_BLOCKED_RESOURCE_TYPES", "image,media,font,texttrack,manifest")
+)
+# Tracker and tag manager domains (and their subdomains) aborted in fast mode
+SCRAPE_BLOCKED_DOMAINS = env_list(
+    "SCRAPE_BLOCKED_DOMAINS",
+    "google-analytics.com,googletagmanager.com,doubleclick.net,googlesyndication.com,"
+    "facebook.net,hotjar.com,clarity.ms,bat.bing.com,"
+    "snap.licdn.com,demdex.net,omtrdc.net,everesttech.net,qualtrics.com,"
+    "optimizely.com,newrelic.com,nr-data.net,trustarc.com,onetrust.com,cookielaw.org",
+)
+# Domains always loaded, whatever their resource type
+SCRAPE_ALLOWED_DOMAINS = env_list("SCRAPE_ALLOWED_DOMAINS", "")
+
+# Try a plain HTTP fetch before the browser; pages whose initial HTML already
+# has the h1, meta description and enough body copy never open a browser page
+SCRAPE_STATIC_FIRST = os.getenv("SCRAPE_STATIC_FIRST", "true").lower() == "true"
+SCRAPE_STATIC_TIMEOUT = float(os.getenv("SCRAPE_STATIC_TIMEOUT", "10"))
+# Characters of condensed page text below which the static HTML is incomplete
+SCRAPE_STATIC_MIN_TEXT_CHARS = int(os.getenv("SCRAPE_STATIC_MIN_TEXT_CHARS", "500"))
+SCRAPE_HTTP_MAX_CONNECTIONS = int(os.getenv("SCRAPE_HTTP_MAX_CONNECTIONS", "20"))
+
+# String types included in Tag.get_text for content elements (no comments,
+# doctypes or script/style/template strings)
+TEXT_STRING_TYPES = (NavigableString, CData)
+# get_on_page_copy element types listed as headings ahead of the body text
+HEADING_ELEMENTS = ["h1", "h2", "h3", "h4"]
+
 
 class PageScraper:
     def __init__(self, soup, title=""):
@@ -119,25 +170,25 @@ class PageScraper:
         # Data collection with improved filtering
         data = [{"title": self.title}]
 
-        for element_type in content_elements:
+        for element_type, texts in self._element_texts(content_elements).items():
             sub_data = {element_type: []}
-            all_tags = self.soup.find_all(element_type)
-
-            for tag in all_tags:
-                # Additional filtering to remove short or irrelevant text
-                text = tag.get_text(" ", strip=True)
+            seen = set()
 
+            for text in texts:
                 # Skip very short text (likely not meaningful content)
                 if len(text) < 10:
                     continue
 
+                # Avoid duplicates
+                if text in seen:
+                    continue
+                seen.add(text)
+
                 # Skip text with too many numbers or special characters
                 if self._is_noise(text):
                     continue
 
-                # Avoid duplicates
-                if text and text not in sub_data[element_type]:
-                    sub_data[element_type].append(text)
+                sub_data[element_type].append(text)
 
             # Only add non-empty element types
             if sub_data[element_type]:
@@ -145,12 +196,48 @@ class PageScraper:
 
         return data
 
+    def _element_texts(self, element_types):
+        """
+        Text of every element of `element_types`, as tag.get_text(" ", strip=True)
+        returns it, in one walk of the tree instead of one find_all and one
+        subtree traversal per element.
+        Returns: {element_type: [text, ...]} in document order
+        """
+        wanted = set(element_types)
+        # Stripped strings in document order; an element's text is the slice
+        # of strings added between its start and its end
+        strings = []
+        spans = {element_type: [] for element_type in element_types}
+        stack = [(None, iter(self.soup.children))]
+        while stack:
+            span, children = stack[-1]
+            child = next(children, None)
+            if child is None:
+                stack.pop()
+                if span is not None:
+                    span[1] = len(strings)
+            elif isinstance(child, Tag):
+                span = None
+                if child.name in wanted:
+                    span = [len(strings), None]
+                    spans[child.name].append(span)
+                stack.append((span, iter(child.contents)))
+            elif type(child) in TEXT_STRING_TYPES:
+                text = child.strip()
+                if text:
+                    strings.append(text)
+
+        return {
+            element_type: [" ".join(strings[start:end]) for start, end in element_spans]
+            for element_type, element_spans in spans.items()
+        }
+
     def _is_noise(self, text, max_noise_ratio=0.4):
         if not text:
             return True
 
         # Count alphabetic and non-alphabetic characters
-        alphabetic_count = sum(1 for char in text if char.isalpha())
+        alphabetic_count = sum(map(str.isalpha, text))
         total_count = len(text)
 
         # Calculate noise ratio
@@ -169,71 +256,321 @@ class PageScraper:
         }
 
 
-async def scrape_data(url: str) -> dict:
-    logging.info(f"Starting to scrape URL: {url}")
-    async with async_playwright() as p:
-        browser = await p.chromium.launch()
-        ua = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/116.0.0.0 Safari/537.36"
-
-        page = await browser.new_page(user_agent=ua)
-        try:
-            await page.goto(url, timeout=100000)
-            logging.info(f"Successfully accessed URL: {url}")
-        except PlaywrightTimeoutError as e:
-            logging.error(f"Timeout error while accessing URL {url}: {e}")
-            return {"origin_url": url, "error": "Timeout error"}
-        await page.wait_for_load_state("load")
-        time.sleep(4)
-        html_content = await page.content()
-        soup = BeautifulSoup(html_content, "html.parser")
-        os.makedirs("scraped_html", exist_ok=True)
-        filename = f"scraped_html/{url.replace('https://', '').replace('/', '_')}.html"
-        with open(filename, "w", encoding="utf-8") as f:
-            f.write(html_content)
-        logging.info(f"HTML content saved to {filename}")
-
-        title = await page.title()
-        page_url = page.url
-        scraper = PageScraper(soup, title)
-        headings = scraper.get_headings()
-        page_text = scraper.get_on_page_copy()
-        await browser.close()
-
-        logging.info(f"Successfully scraped data from URL: {url}")
-        result_df = {
-            "title": title,
-            "meta_desc": scraper.get_description(),
-            "h1": headings["h1"] if headings["h1"] else "",
-            "h2": headings["h2"] if len(headings["h2"]) > 0 else "",
-            "h3": headings["h3"] if len(headings["h3"]) > 1 else "",
-            "page_text": page_text,
-        }
-
-        print(result_df)
-        # Create JSON object
-        scraped_data = {
-            "origin_url": url,
-            "title": title,
-            "meta_desc": scraper.get_description(),
-            "h1-1": headings["h1"][0] if headings["h1"] else "",
-            "H2-1": headings["h2"][0] if len(headings["h2"]) > 0 else "",
-            "H2-2": headings["h2"][1] if len(headings["h2"]) > 1 else "",
-            "url_slug": scraper.get_url_slug(url),
-            "page_text": result_df,  # Use the dictionary directly
+def condense_page_text(page_copy, max_chars=PAGE_TEXT_MAX_CHARS):
+    """
+    Canonical text of a page for the LLM extraction prompts, built from the
+    output of PageScraper.get_on_page_copy. Nested div/span/section elements
+    repeat the text of their children, so only blocks not contained in a
+    longer block are kept. The title and headings come first; the result is
+    cut to `max_chars` at a word boundary.
+    """
+    blocks = {}
+    for entry in page_copy:
+        for element_type, texts in entry.items():
+            blocks.setdefault(element_type, []).extend(
+                [texts] if isinstance(texts, str) else texts
+            )
+
+    lines = [f"Title: {title}" for title in blocks.pop("title", []) if title]
+    for element_type in HEADING_ELEMENTS:
+        lines.extend(f"{element_type.upper()}: {text}" for text in blocks.pop(element_type, []))
+
+    def unique_blocks():
+        # Generated lazily so the containment scan stops once the text is full
+        kept = []
+        for text in sorted({text for texts in blocks.values() for text in texts}, key=len, reverse=True):
+            if not any(text in longer for longer in kept):
+                kept.append(text)
+                yield text
+
+    condensed = []
+    remaining = max_chars
+    for line in itertools.chain(lines, unique_blocks()):
+        if len(line) >= remaining:
+            cut = line[:remaining].rsplit(" ", 1)[0]
+            if cut and remaining > 1:
+                condensed.append(cut)
+            break
+        condensed.append(line)
+        remaining -= len(line) + 1
+    return "\n".join(condensed)
+
+
+_http_client = None
+_scrape_stats = {}
+_scrape_stats_lock = threading.Lock()
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/116.0.0.0 Safari/537.36"
+
+
+def domain_matches(host, domains):
+    return any(host == domain or host.endswith("." + domain) for domain in domains)
+
+
+def is_blocked_request(resource_type, url):
+    host = urlparse(url).hostname or ""
+    if domain_matches(host, SCRAPE_ALLOWED_DOMAINS):
+        return False
+    return resource_type in SCRAPE_BLOCKED_RESOURCE_TYPES or domain_matches(
+        host, SCRAPE_BLOCKED_DOMAINS
+    )
+
+
+async def block_resources(page):
+    """
+    Abort the page's requests for non-essential resources.
+    Returns: dict counting the blocked and loaded requests
+    """
+    counts = {"blocked": 0, "loaded": 0}
+
+    async def handle(route):
+        request = route.request
+        if is_blocked_request(request.resource_type, request.url):
+            counts["blocked"] += 1
+            await route.abort()
+        else:
+            counts["loaded"] += 1
+            await route.continue_()
+
+    await page.route("**/*", handle)
+    return counts
+
+
+def get_http_client():
+    """Shared async HTTP client of the static scraping path"""
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(
+            headers={"User-Agent": USER_AGENT},
+            timeout=SCRAPE_STATIC_TIMEOUT,
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=SCRAPE_HTTP_MAX_CONNECTIONS),
+        )
+    return _http_client
+
+
+async def close_http_client():
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+def record_scrape(url, path, reason=None, seconds=0.0):
+    domain = urlparse(url).hostname or ""
+    with _scrape_stats_lock:
+        stats = _scrape_stats.setdefault(
+            domain,
+            {"static": 0, "browser": 0, "static_seconds": 0.0, "browser_seconds": 0.0, "fallback_reasons": {}},
+        )
+        stats[path] += 1
+        stats[f"{path}_seconds"] += seconds
+        if reason:
+            stats["fallback_reasons"][reason] = stats["fallback_reasons"].get(reason, 0) + 1
+
+
+def scrape_stats():
+    """Per domain: scrapes served from static HTML vs the browser, and why the browser was needed"""
+    with _scrape_stats_lock:
+        return {
+            domain: {
+                **stats,
+                "static_seconds": round(stats["static_seconds"], 3),
+                "browser_seconds": round(stats["browser_seconds"], 3),
+                "fallback_reasons": dict(stats["fallback_reasons"]),
+            }
+            for domain, stats in _scrape_stats.items()
         }
 
-        # Save individual JSON file for each URL
-        json_file_path = os.path.join("scraped_json", f"{page_url.split('/')[-1]}.json")
-        with open(json_file_path, "w", encoding="utf-8") as f:
-            json.dump(result_df, f, ensure_ascii=False, indent=4)
-
-        logging.info(f"Saved scraped data to JSON: {json_file_path}")
 
-        return scraped_data
-
-
-async def scrape_url(url: str) -> pd.DataFrame:
+def missing_fields(scraped_data):
+    """Required fields absent from a scrape; the static path escalates if any are"""
+    missing = []
+    if not scraped_data["h1-1"]:
+        missing.append("h1")
+    if not scraped_data["meta_desc"]:
+        missing.append("meta_desc")
+    if len(scraped_data["page_text"]) < SCRAPE_STATIC_MIN_TEXT_CHARS:
+        missing.append("page_text")
+    return missing
+
+
+async def scrape_static(url):
+    """
+    Fetch `url` without a browser and parse its initial HTML.
+    Returns: (scraped_data, None) when every required field is present,
+    otherwise (None, reason the browser is needed)
+    """
+    try:
+        response = await get_http_client().get(url)
+        response.raise_for_status()
+    except httpx.HTTPError as e:
+        logging.info(f"Static fetch of {url} failed, using the browser: {e}")
+        return None, "http_error"
+    if "html" not in response.headers.get("content-type", ""):
+        return None, "not_html"
+
+    html_content = response.text
+    scraped_data, result_df = await asyncio.to_thread(parse_page, html_content, url)
+    missing = missing_fields(scraped_data)
+    if missing:
+        logging.info(f"Static HTML of {url} lacks {', '.join(missing)}, using the browser")
+        return None, f"missing {', '.join(missing)}"
+
+    await asyncio.to_thread(
+        save_scraped_page, url, str(response.url), html_content, result_df
+    )
+    return scraped_data, None
+
+
+async def scrape_data(url: str, fast=SCRAPE_FAST_MODE, static_first=SCRAPE_STATIC_FIRST) -> dict:
+    """
+    Scrape `url` from its static HTML when that has every required field,
+    otherwise with the shared browser pool.
+    """
+    logging.info(f"Starting to scrape URL: {url}")
+    started = time.perf_counter()
+    reason = None
+    if static_first:
+        scraped_data, reason = await scrape_static(url)
+        if scraped_data is not None:
+            record_scrape(url, "static", seconds=time.perf_counter() - started)
+            return scraped_data
+
+    scraped_data = await scrape_with_browser(url, fast)
+    record_scrape(url, "browser", reason, time.perf_counter() - started)
+    return scraped_data
+
+
+async def scrape_with_browser(url: str, fast=SCRAPE_FAST_MODE) -> dict:
+    """
+    Scrape `url` in a fresh context of the worker's shared browser pool.
+    In `fast` mode images, fonts, media and tracker requests are aborted.
+    """
+    async with get_browser_pool().page(user_agent=USER_AGENT) as page:
+        counts = await block_resources(page) if fast else None
+        result = await scrape_with_page(page, url)
+        if counts is not None:
+            logging.info(
+                f"Fast mode for {url}: blocked {counts['blocked']} requests, "
+                f"loaded {counts['loaded']}"
+            )
+        return result
+
+
+async def wait_for_selector_ready(page, selector, timeout):
+    try:
+        await page.wait_for_selector(selector, state="attached", timeout=timeout * 1000)
+        return True
+    except PlaywrightTimeoutError:
+        return False
+
+
+async def wait_for_network_idle(page, timeout):
+    try:
+        await page.wait_for_load_state("networkidle", timeout=timeout * 1000)
+        return True
+    except PlaywrightTimeoutError:
+        return False
+
+
+async def wait_until_ready(page, url):
+    """
+    Wait for the page content to render without blocking the event loop.
+    Returns once the ready selector is attached and the network is idle, or
+    when the longer of the two timeouts has passed.
+    """
+    content_ready, network_idle = await asyncio.gather(
+        wait_for_selector_ready(page, SCRAPE_READY_SELECTOR, SCRAPE_CONTENT_TIMEOUT),
+        wait_for_network_idle(page, SCRAPE_NETWORK_IDLE_TIMEOUT),
+    )
+    if not content_ready:
+        logging.warning(f"No element matching {SCRAPE_READY_SELECTOR!r} on {url}")
+    if not network_idle:
+        logging.info(f"Network still busy on {url}, scraping the current DOM")
+
+
+async def scrape_with_page(page, url: str) -> dict:
+    try:
+        await page.goto(url, timeout=100000)
+        logging.info(f"Successfully accessed URL: {url}")
+    except PlaywrightTimeoutError as e:
+        logging.error(f"Timeout error while accessing URL {url}: {e}")
+        return {"origin_url": url, "error": "Timeout error"}
+
+    await page.wait_for_load_state("load")
+    await wait_until_ready(page, url)
+    html_content = await page.content()
+    title = await page.title()
+    scraped_data, result_df = await asyncio.to_thread(parse_page, html_content, url, title)
+    await asyncio.to_thread(save_scraped_page, url, page.url, html_content, result_df)
+    return scraped_data
+
+
+def parse_page(html_content, url, title=None):
+    """
+    Extract the scraped fields from the HTML of a page; `title` defaults to
+    the document's <title>.
+    Returns: (scraped_data, result_df) where result_df holds the full page copy
+    """
+    soup = BeautifulSoup(html_content, "html.parser")
+    if title is None:
+        title = soup.title.get_text(strip=True) if soup.title else ""
+    scraper = PageScraper(soup, title)
+    headings = scraper.get_headings()
+    # Read before get_on_page_copy, which removes the <meta> tags from the soup
+    meta_desc = scraper.get_description()
+    page_text = scraper.get_on_page_copy()
+
+    logging.info(f"Parsed page content of URL: {url}")
+    result_df = {
+        "title": title,
+        "meta_desc": meta_desc,
+        "h1": headings["h1"] if headings["h1"] else "",
+        "h2": headings["h2"] if len(headings["h2"]) > 0 else "",
+        "h3": headings["h3"] if len(headings["h3"]) > 1 else "",
+        "page_text": page_text,
+    }
+
+    # Create JSON object
+    scraped_data = {
+        "origin_url": url,
+        "title": title,
+        "meta_desc": meta_desc,
+        "h1-1": headings["h1"][0] if headings["h1"] else "",
+        "H2-1": headings["h2"][0] if len(headings["h2"]) > 0 else "",
+        "H2-2": headings["h2"][1] if len(headings["h2"]) > 1 else "",
+        "url_slug": scraper.get_url_slug(url),
+        # Condensed once here and reused by every keyword, synonym and
+        # outline extraction prompt of the pipeline
+        "page_text": condense_page_text(page_text),
+        # Full copy of the page, rewritten by content creation and used to
+        # measure the optimised content against
+        "page_copy": result_df,
+    }
+    return scraped_data, result_df
+
+
+def save_scraped_page(url, page_url, html_content, result_df):
+    os.makedirs("scraped_html", exist_ok=True)
+    filename = f"scraped_html/{url.replace('https://', '').replace('/', '_')}.html"
+    with open(filename, "w", encoding="utf-8") as f:
+        f.write(html_content)
+    logging.info(f"HTML content saved to {filename}")
+
+    print(result_df)
+    # Save individual JSON file for each URL
+    json_file_path = os.path.join("scraped_json", f"{page_url.split('/')[-1]}.json")
+    with open(json_file_path, "w", encoding="utf-8") as f:
+        json.dump(result_df, f, ensure_ascii=False, indent=4)
+
+    logging.info(f"Saved scraped data to JSON: {json_file_path}")
+
+
+async def scrape_url(
+    url: str, fast=SCRAPE_FAST_MODE, static_first=SCRAPE_STATIC_FIRST
+) -> pd.DataFrame:
     logging.info(f"Starting scraping for URL: {url}")
-    result = await scrape_data(url)
+    result = await scrape_data(url, fast, static_first)
     logging.info("Scraping completed.")
     return pd.DataFrame([result])
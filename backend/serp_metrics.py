@@ -1,4 +1,5 @@
-import requests
+import asyncio
+import httpx
 from typing import Dict, Optional
 from datetime import datetime
 import os
@@ -6,6 +7,43 @@ from dotenv import load_dotenv
 
 load_dotenv()
 API_TOKEN = os.getenv("API_TOKEN")
+# Ahrefs requests allowed in flight at once on the event loop
+AHREFS_MAX_CONCURRENT_REQUESTS = int(os.getenv("AHREFS_MAX_CONCURRENT_REQUESTS", "10"))
+AHREFS_TIMEOUT = float(os.getenv("AHREFS_TIMEOUT", "30"))
+
+_async_client = None
+_semaphore = None
+
+
+def get_async_client():
+    """Shared async HTTP client and semaphore for Ahrefs requests"""
+    global _async_client, _semaphore
+    if _async_client is None:
+        _async_client = httpx.AsyncClient(
+            timeout=AHREFS_TIMEOUT,
+            limits=httpx.Limits(max_connections=AHREFS_MAX_CONCURRENT_REQUESTS),
+        )
+        _semaphore = asyncio.Semaphore(AHREFS_MAX_CONCURRENT_REQUESTS)
+    return _async_client, _semaphore
+
+
+async def close_async_client():
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+
+
+async def get_json_async(url, headers, params):
+    """
+    GET `url` on the shared client. Raises httpx.HTTPError, or ValueError when
+    the body isn't JSON (e.g. an error page from a proxy)
+    """
+    client, semaphore = get_async_client()
+    async with semaphore:
+        response = await client.get(url, headers=headers, params=params)
+    response.raise_for_status()
+    return response.json()
 
 
 class SerpAPI:
@@ -17,8 +55,11 @@ class SerpAPI:
             "Authorization": f"Bearer {self.api_token}",
         }
 
-    def get_serp_data(self, keyword: str, country: str = "us") -> Optional[Dict]:
-        """Get SERP overview data for a keyword"""
+    async def get_serp_data_async(self, keyword: str, country: str = "us") -> Dict:
+        """
+        Get SERP overview data for a keyword.
+        Raises: httpx.HTTPError or ValueError (see get_json_async)
+        """
         url = f"{self.base_url}/serp-overview/serp-overview"
 
         querystring = {
@@ -28,13 +69,7 @@ class SerpAPI:
             "output": "json",
         }
 
-        try:
-            response = requests.get(url, headers=self.headers, params=querystring)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            print(f"Error fetching SERP data for {keyword}: {e}")
-            return None
+        return await get_json_async(url, self.headers, querystring)
 
 
 def process_serp_data(serp_data: Dict, keyword: str, target_url: str = None) -> tuple:
@@ -99,10 +134,8 @@ def process_serp_data(serp_data: Dict, keyword: str, target_url: str = None) ->
     return keyword_metrics, [competitor_data]
 
 
-def get_difficulty_metrics(df):
-    """Get difficulty metrics for multiple keywords in bulk"""
+def difficulty_request(keywords):
     url = "https://api.ahrefs.com/v3/keywords-explorer/overview"
-    keywords = df.keyword.to_list()
 
     querystring = {
         "select": "keyword,difficulty,cpc",
@@ -114,24 +147,15 @@ def get_difficulty_metrics(df):
         "Accept": "application/json, application/xml",
         "Authorization": f"Bearer {API_TOKEN}",
     }
+    return url, headers, querystring
 
-    try:
-        response = requests.get(url, headers=headers, params=querystring)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        print(f"Error fetching difficulty metrics: {e}")
-        return {"keywords": []}
 
-
-def get_metrics_and_ranking(keyword: str, target_url: str = None):
+async def get_difficulty_metrics_for_keywords_async(keywords):
     """
-    Combined function to get both keyword metrics and competitor rankings
+    Get difficulty metrics for a list of keywords in one request.
+    Raises: httpx.HTTPError or ValueError (see get_json_async)
     """
-    api = SerpAPI()
-    serp_data = api.get_serp_data(keyword)
+    url, headers, querystring = difficulty_request(keywords)
 
-    if not serp_data:
-        return None, None
+    return await get_json_async(url, headers, querystring)
 
-    return process_serp_data(serp_data, keyword, target_url)
@@ -0,0 +1,194 @@
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future
+import httpx
+from serp_metrics import SerpAPI, get_difficulty_metrics_for_keywords_async
+from utility import get_embeddings_if_valid, classify_intents_async
+
+# Failures of Ahrefs requests (see serp_metrics.get_json_async). They are not
+# memoised: the keyword gets no metrics now and the next caller retries it
+AHREFS_ERRORS = (httpx.HTTPError, ValueError)
+
+
+class Abandoned(Exception):
+    """Set on a key's future when the caller computing it was cancelled"""
+
+
+class SharedWork:
+    """
+    Memo of external API results shared by every page processed together.
+
+    Each (namespace, key) is computed once; concurrent callers asking for the
+    same key wait for the call already in flight instead of issuing their own.
+    Failed calls are not memoised so a later caller can retry them. If the
+    caller computing a key is cancelled (e.g. its page failed), the key is
+    dropped and the callers waiting for it compute it again.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._futures = {}
+        self.stats = {}
+
+    async def get_or_compute_async(self, namespace, key, func, *args):
+        """
+        Result of `await func(*args)` for (namespace, key), computed once;
+        concurrent callers await the call already in flight
+        """
+        while True:
+            with self._lock:
+                future = self._futures.get((namespace, key))
+                owner = future is None
+                if owner:
+                    future = Future()
+                    self._futures[(namespace, key)] = future
+                self._count(namespace, "calls" if owner else "hits")
+
+            if owner:
+                try:
+                    result = await func(*args)
+                except asyncio.CancelledError:
+                    self._release(namespace, [key])
+                    raise
+                except Exception as e:
+                    self._release(namespace, [key], e)
+                    raise
+                future.set_result(result)
+                return result
+
+            try:
+                return await self._wait(future)
+            except Abandoned:
+                continue
+
+    @staticmethod
+    async def _wait(future):
+        # Shielded: a waiter being cancelled must not cancel the shared future
+        # that other pages are waiting on
+        return await asyncio.shield(asyncio.wrap_future(future))
+
+    def _count(self, namespace, field):
+        counts = self.stats.setdefault(namespace, {"calls": 0, "hits": 0})
+        counts[field] += 1
+
+    def embeddings(self, texts):
+        """
+        Embeddings for `texts`, sending only texts no other page has asked for
+        yet to the embedding API, together in batched requests.
+        """
+        futures, owned = self._claim("embedding", texts)
+        if owned:
+            try:
+                vectors = get_embeddings_if_valid(owned)
+            except Exception as e:
+                self._release("embedding", owned, e)
+                raise
+            for text, vector in zip(owned, vectors):
+                futures[text].set_result(vector)
+        return [futures[text].result() for text in texts]
+
+    def _claim(self, namespace, keys):
+        """
+        Get a future for every key, creating the ones nobody requested yet.
+        Returns: ({key: future}, [keys the caller must compute])
+        """
+        futures, owned = {}, []
+        with self._lock:
+            for key in dict.fromkeys(keys):
+                future = self._futures.get((namespace, key))
+                if future is None:
+                    future = Future()
+                    self._futures[(namespace, key)] = future
+                    owned.append(key)
+                futures[key] = future
+            self._count(namespace, "calls" if owned else "hits")
+        return futures, owned
+
+    def _release(self, namespace, keys, error=None):
+        """
+        Forget claimed keys that were not computed. Their waiters get `error`,
+        or compute the keys again when the caller was cancelled (no error).
+        """
+        with self._lock:
+            for key in keys:
+                future = self._futures.pop((namespace, key))
+                future.set_exception(error or Abandoned())
+
+    async def intents_async(self, keywords):
+        """
+        Intents of `keywords`, classifying only keywords no other page has
+        asked for yet, in batched requests.
+        """
+        futures, owned = self._claim("intent", keywords)
+        if owned:
+            try:
+                intents = await classify_intents_async(owned)
+            except asyncio.CancelledError:
+                self._release("intent", owned)
+                raise
+            except Exception as e:
+                self._release("intent", owned, e)
+                raise
+            for keyword, intent in zip(owned, intents):
+                futures[keyword].set_result(intent)
+
+        results, abandoned = {}, []
+        for keyword, future in futures.items():
+            try:
+                results[keyword] = await self._wait(future)
+            except Abandoned:
+                abandoned.append(keyword)
+        if abandoned:
+            results.update(zip(abandoned, await self.intents_async(abandoned)))
+        return [results[keyword] for keyword in keywords]
+
+    async def serp_data_async(self, keyword):
+        """SERP overview of `keyword`. Returns: None if the request failed"""
+        try:
+            return await self.get_or_compute_async(
+                "serp", keyword, SerpAPI().get_serp_data_async, keyword
+            )
+        except AHREFS_ERRORS as e:
+            print(f"Error fetching SERP data for {keyword}: {e}")
+            return None
+
+    async def difficulty_async(self, keywords):
+        """
+        Difficulty metrics for `keywords`, fetching only the keywords no other
+        page has requested yet in a single bulk call. Keywords whose request
+        failed are left out.
+        Returns: {"keywords": [{"keyword", "difficulty", "cpc"}, ...]}
+        """
+        keywords = list(dict.fromkeys(keywords))
+        futures, owned = self._claim("difficulty", keywords)
+        if owned:
+            logging.info(
+                f"Fetching difficulty for {len(owned)} of {len(keywords)} keywords"
+            )
+            try:
+                metrics = await get_difficulty_metrics_for_keywords_async(owned)
+            except asyncio.CancelledError:
+                self._release("difficulty", owned)
+                raise
+            except Exception as e:
+                self._release("difficulty", owned, e)
+                if not isinstance(e, AHREFS_ERRORS):
+                    raise
+                print(f"Error fetching difficulty metrics: {e}")
+            else:
+                by_keyword = {item["keyword"]: item for item in metrics["keywords"]}
+                for keyword in owned:
+                    futures[keyword].set_result(by_keyword.get(keyword))
+
+        results, abandoned = [], []
+        for keyword in keywords:
+            try:
+                results.append(await self._wait(futures[keyword]))
+            except Abandoned:
+                abandoned.append(keyword)
+            except AHREFS_ERRORS:
+                continue
+        if abandoned:
+            results.extend((await self.difficulty_async(abandoned))["keywords"])
+        return {"keywords": [item for item in results if item is not None]}
@@ -0,0 +1,75 @@
+import asyncio
+import importlib
+import logging
+import sys
+import types
+
+import pytest
+
+
+@pytest.fixture
+def batch(monkeypatch):
+    # pipeline and utility need the service account setup at import; the
+    # tests replace run_pipeline and don't use the utility functions
+    for name in ("pipeline", "utility"):
+        module = types.ModuleType(name)
+        monkeypatch.setitem(sys.modules, name, module)
+    sys.modules["pipeline"].run_pipeline = None
+    sys.modules["utility"].get_embeddings_if_valid = None
+    sys.modules["utility"].classify_intents_async = None
+    for name in ("batch", "shared_work"):
+        monkeypatch.delitem(sys.modules, name, raising=False)
+    return importlib.import_module("batch")
+
+
+async def collect(batch, urls, **kwargs):
+    return [item async for item in batch.run_batch(urls, **kwargs)]
+
+
+def test_failing_urls_do_not_abort_the_batch(batch, monkeypatch):
+    async def run_pipeline(url, shared=None):
+        await asyncio.sleep(0.01)
+        if url == "error":
+            raise RuntimeError("outline generation failed")
+        if url == "cancelled":
+            # e.g. work shared with another page that was cancelled
+            raise asyncio.CancelledError()
+        await asyncio.sleep(0.02)
+        return {"page": url}
+
+    monkeypatch.setattr(batch, "run_pipeline", run_pipeline)
+
+    items = asyncio.run(collect(batch, ["error", "cancelled", "ok"]))
+
+    by_url = {item["url"]: item for item in items}
+    assert by_url["error"] == {
+        "url": "error",
+        "status": "failed",
+        "error": "outline generation failed",
+    }
+    assert by_url["cancelled"]["status"] == "failed"
+    assert by_url["ok"] == {"url": "ok", "status": "completed", "result": {"page": "ok"}}
+
+
+def test_closing_the_batch_cancels_remaining_urls(batch, monkeypatch, caplog):
+    finished = []
+
+    async def run_pipeline(url, shared=None):
+        await asyncio.sleep(0.01 if url == "fast" else 10)
+        finished.append(url)
+        return {"page": url}
+
+    monkeypatch.setattr(batch, "run_pipeline", run_pipeline)
+
+    async def main():
+        items = batch.run_batch(["fast", "slow"])
+        first = await items.__anext__()
+        await items.aclose()
+        return first
+
+    with caplog.at_level(logging.ERROR):
+        first = asyncio.run(main())
+
+    assert first["url"] == "fast"
+    assert finished == ["fast"]
+    assert "slow" not in caplog.text
@@ -0,0 +1,193 @@
+import importlib
+import os
+
+import pytest
+from bs4 import BeautifulSoup
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+NESTED_HEADINGS = """
+<html><body>
+<h1>Main product heading</h1>
+<section><article>
+  <h2>Overview of the <span>nuclease</span> product</h2>
+  <div><h3>Nested heading <em>inside</em> a div block</h3>
+    <div><h4>Deeper heading <b>with <i>inline</i> markup</b></h4>
+      <p>Paragraph under the deepest heading, with <a href="#">a link</a>.</p>
+    </div>
+  </div>
+  <ul><li>First list item text</li><li>Second list item text</li></ul>
+  <ol><li>Ordered step one here</li><li>Ordered step two here</li></ol>
+</article></section>
+</body></html>
+"""
+
+TEMPLATE = """
+<html><body>
+<div>Visible text next to a template
+  <template><p>Paragraph inside a template element</p><span>Template span text</span></template>
+</div>
+<template><div><h2>Heading only in a template</h2></div></template>
+<p>Paragraph after the template elements</p>
+</body></html>
+"""
+
+CDATA = """
+<html><body>
+<div>Text before the CDATA section <![CDATA[CDATA section text content]]> and after it</div>
+<p><![CDATA[Paragraph made only of CDATA text]]></p>
+<span>Span with a comment <!-- comment text is not copy --> in the middle</span>
+</body></html>
+"""
+
+WHITESPACE = """
+<html><body>
+<p>   Leading and trailing spaces around text   </p>
+<p>Leading and trailing spaces around text</p>
+<div>
+    Text split
+    over several
+
+    lines <span>	with tabs	</span>
+</div>
+<p>Non breaking spaces in this text</p>
+<p><span>  </span>Short</p>
+<div><span>Adjacent</span><span>spans without spaces</span></div>
+<p>1234567890 !!!! ???? 5678</p>
+<header><p>Header paragraph that is dropped</p></header>
+<div class="footer">Footer text that is dropped too</div>
+<div role="button">Button text that is dropped</div>
+</body></html>
+"""
+
+
+def baseline_on_page_copy(scraper, soup, title):
+    """
+    PageScraper.get_on_page_copy as it was before the single-walk extraction:
+    one find_all and one get_text per element
+    """
+    page = scraper.PageScraper(soup, title)
+    for button in soup.find_all(attrs={"role": "button"}):
+        button.decompose()
+    for hidden in soup(
+        ["script", "style", "meta", "noscript", "svg", "iframe", "form", "button", "link"]
+    ):
+        hidden.decompose()
+    for selector in [
+        ".header", ".footer", "#header", "#footer", "header", "footer",
+        ".site-header", ".site-footer", ".main-header", ".main-footer",
+        "nav", ".navigation", "#navigation", ".pdp-header",
+    ]:
+        for element in soup.select(selector):
+            element.decompose()
+
+    data = [{"title": title}]
+    for element_type in ["h1", "h2", "h3", "h4", "div", "p", "ul", "ol", "span", "article", "section"]:
+        sub_data = {element_type: []}
+        for tag in soup.find_all(element_type):
+            text = tag.get_text(" ", strip=True)
+            if len(text) < 10:
+                continue
+            if page._is_noise(text):
+                continue
+            if text and text not in sub_data[element_type]:
+                sub_data[element_type].append(text)
+        if sub_data[element_type]:
+            data.append(sub_data)
+    return data
+
+
+@pytest.fixture
+def scraper(tmp_path, monkeypatch):
+    # The scraper creates logs/ and scraped_json/ on import and writes
+    # scraped_html.txt to the working directory
+    monkeypatch.chdir(tmp_path)
+    return importlib.import_module("scraper")
+
+
+def on_page_copy(scraper, html, title="Page title"):
+    return scraper.PageScraper(BeautifulSoup(html, "html.parser"), title).get_on_page_copy()
+
+
+@pytest.mark.parametrize(
+    "html",
+    [NESTED_HEADINGS, TEMPLATE, CDATA, WHITESPACE],
+    ids=["nested_headings", "template", "cdata", "whitespace"],
+)
+def test_on_page_copy_matches_baseline(scraper, html):
+    expected = baseline_on_page_copy(scraper, BeautifulSoup(html, "html.parser"), "Page title")
+    assert on_page_copy(scraper, html) == expected
+
+
+def test_on_page_copy_matches_baseline_on_scraped_page(scraper):
+    with open(os.path.join(BACKEND_DIR, "scraped_html.txt")) as f:
+        html = f.read()
+    expected = baseline_on_page_copy(scraper, BeautifulSoup(html, "html.parser"), "Page title")
+    assert on_page_copy(scraper, html) == expected
+
+
+def test_on_page_copy_deeply_nested(scraper):
+    depth = 60
+    html = (
+        "<html><body><section>"
+        + "".join(f"<div><span>Sentence {i} of the product description.</span>" for i in range(depth))
+        + "</div>" * depth
+        + "</section></body></html>"
+    )
+    expected = baseline_on_page_copy(scraper, BeautifulSoup(html, "html.parser"), "Page title")
+    assert on_page_copy(scraper, html) == expected
+
+
+def test_on_page_copy_drops_short_noisy_and_duplicate_text(scraper):
+    copy = on_page_copy(scraper, WHITESPACE)
+    texts = [text for entry in copy[1:] for values in entry.values() for text in values]
+    assert copy[0] == {"title": "Page title"}
+    assert {"p": [
+        "Leading and trailing spaces around text",
+        "Non breaking spaces in this text",
+    ]} in copy
+    assert not any("dropped" in text for text in texts)
+    assert not any(text.startswith("1234567890") for text in texts)
+
+
+def test_condense_page_text_keeps_unique_blocks_after_headings(scraper):
+    page_copy = [
+        {"title": "Page title"},
+        {"h1": ["Main product heading"]},
+        {"div": ["Outer block with inner text and more", "inner text and more"]},
+        {"span": ["inner text and more", "Another separate block"]},
+    ]
+
+    assert scraper.condense_page_text(page_copy) == "\n".join(
+        [
+            "Title: Page title",
+            "H1: Main product heading",
+            "Outer block with inner text and more",
+            "Another separate block",
+        ]
+    )
+
+
+def test_condense_page_text_is_cut_at_a_word_boundary(scraper):
+    page_copy = [
+        {"title": "Page title"},
+        {"p": [f"Paragraph number {i} about nucleases" for i in range(1000)]},
+    ]
+
+    condensed = scraper.condense_page_text(page_copy, max_chars=200)
+
+    assert len(condensed) <= 200
+    assert condensed.startswith("Title: Page title\n")
+    assert all(line.endswith("nucleases") for line in condensed.splitlines()[1:-1])
+
+
+def test_parse_page_keeps_full_copy_next_to_condensed_text(scraper):
+    with open(os.path.join(BACKEND_DIR, "scraped_html.txt")) as f:
+        html = f.read()
+
+    scraped_data, result_df = scraper.parse_page(html, "https://example.com/product")
+
+    # Content creation rewrites, and is measured against, the full copy
+    assert scraped_data["page_copy"] is result_df
+    assert scraped_data["page_text"] == scraper.condense_page_text(result_df["page_text"])
+    assert len(scraped_data["page_text"]) <= scraper.PAGE_TEXT_MAX_CHARS
@@ -0,0 +1,161 @@
+import asyncio
+import importlib
+import sys
+import types
+
+import pytest
+
+from dag import Stage, run_dag
+
+
+@pytest.fixture
+def shared_work(monkeypatch):
+    # utility needs the service account setup at import; SharedWork only uses
+    # its embedding and intent functions, which the tests replace
+    utility = types.ModuleType("utility")
+    utility.get_embeddings_if_valid = None
+    utility.classify_intents_async = None
+    monkeypatch.setitem(sys.modules, "utility", utility)
+    monkeypatch.delitem(sys.modules, "shared_work", raising=False)
+    return importlib.import_module("shared_work")
+
+
+async def run_page(stages):
+    try:
+        return "completed", await run_dag(stages)
+    except Exception as e:
+        return "failed", e
+
+
+def test_waiter_recomputes_key_when_owner_page_fails(shared_work):
+    shared = shared_work.SharedWork()
+    fetches = []
+
+    async def fetch(keyword):
+        fetches.append(keyword)
+        await asyncio.sleep(0.05)
+        return {"keyword": keyword}
+
+    async def serp():
+        return await shared.get_or_compute_async("serp", "nuclease", fetch, "nuclease")
+
+    async def failing_outlines():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("outline generation failed")
+
+    async def delayed_serp():
+        # Starts once page A owns the key, so page B waits for A's call
+        await asyncio.sleep(0.005)
+        return await serp()
+
+    async def main():
+        return await asyncio.gather(
+            run_page([Stage("serp", serp), Stage("outlines", failing_outlines)]),
+            run_page([Stage("serp", delayed_serp)]),
+        )
+
+    page_a, page_b = asyncio.run(main())
+
+    assert page_a[0] == "failed"
+    assert page_b == ("completed", {"serp": {"keyword": "nuclease"}})
+    assert fetches == ["nuclease", "nuclease"]
+    assert shared.stats["serp"] == {"calls": 2, "hits": 1}
+
+
+def test_cancelled_waiter_does_not_cancel_shared_key(shared_work):
+    shared = shared_work.SharedWork()
+
+    async def fetch():
+        await asyncio.sleep(0.05)
+        return "serp data"
+
+    async def main():
+        owner = asyncio.create_task(shared.get_or_compute_async("serp", "kw", fetch))
+        await asyncio.sleep(0.005)
+        waiter = asyncio.create_task(shared.get_or_compute_async("serp", "kw", fetch))
+        await asyncio.sleep(0.005)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        return waiter.cancelled(), await owner
+
+    assert asyncio.run(main()) == (True, "serp data")
+
+
+def test_failure_is_passed_to_waiters_and_not_memoised(shared_work):
+    shared = shared_work.SharedWork()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        if len(calls) == 1:
+            raise ValueError("not JSON")
+        return "serp data"
+
+    async def main():
+        first = await asyncio.gather(
+            shared.get_or_compute_async("serp", "kw", fetch),
+            shared.get_or_compute_async("serp", "kw", fetch),
+            return_exceptions=True,
+        )
+        return first, await shared.get_or_compute_async("serp", "kw", fetch)
+
+    first, retried = asyncio.run(main())
+
+    assert [type(result) for result in first] == [ValueError, ValueError]
+    assert retried == "serp data"
+    assert len(calls) == 2
+
+
+def test_intents_recomputed_when_owner_cancelled(shared_work, monkeypatch):
+    shared = shared_work.SharedWork()
+    batches = []
+
+    async def classify_intents_async(keywords):
+        batches.append(list(keywords))
+        await asyncio.sleep(0.05)
+        return [f"intent of {keyword}" for keyword in keywords]
+
+    monkeypatch.setattr(shared_work, "classify_intents_async", classify_intents_async)
+
+    async def main():
+        owner = asyncio.create_task(shared.intents_async(["a", "b"]))
+        await asyncio.sleep(0.005)
+        waiter = asyncio.create_task(shared.intents_async(["b", "c"]))
+        await asyncio.sleep(0.005)
+        owner.cancel()
+        await asyncio.gather(owner, return_exceptions=True)
+        return await waiter
+
+    assert asyncio.run(main()) == ["intent of b", "intent of c"]
+    assert batches == [["a", "b"], ["c"], ["b"]]
+
+
+def test_difficulty_recomputed_when_owner_cancelled(shared_work, monkeypatch):
+    shared = shared_work.SharedWork()
+    batches = []
+
+    async def get_difficulty_metrics_for_keywords_async(keywords):
+        batches.append(list(keywords))
+        await asyncio.sleep(0.05)
+        return {"keywords": [{"keyword": keyword, "difficulty": 1} for keyword in keywords]}
+
+    monkeypatch.setattr(
+        shared_work,
+        "get_difficulty_metrics_for_keywords_async",
+        get_difficulty_metrics_for_keywords_async,
+    )
+
+    async def main():
+        owner = asyncio.create_task(shared.difficulty_async(["a", "b"]))
+        await asyncio.sleep(0.005)
+        waiter = asyncio.create_task(shared.difficulty_async(["b", "c"]))
+        await asyncio.sleep(0.005)
+        owner.cancel()
+        await asyncio.gather(owner, return_exceptions=True)
+        return await waiter
+
+    result = asyncio.run(main())
+
+    assert sorted(item["keyword"] for item in result["keywords"]) == ["b", "c"]
+    assert batches == [["a", "b"], ["c"], ["b"]]
@@ -1,7 +1,6 @@
 from flask import Flask, request, jsonify
 from google.cloud import bigquery
 from google.oauth2 import service_account
-from openai import OpenAI
 import json
 import time
 import re
@@ -9,11 +8,12 @@ import pandas as pd
 import numpy as np
 from sklearn.metrics.pairwise import cosine_similarity
 import logging
-import faiss
 import concurrent.futures
-import random
 import os
 from dotenv import load_dotenv
+from embedding_service import embed_text, embed_texts
+from llm_gateway import chat_completion
+from index_registry import get_index_registry
 
 load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
@@ -32,9 +32,6 @@ similarity_table_name = "keyword_similarity_scores"
 
 # service_account_key_path = "thermofigher-gen-ai-5255b69aa6e4.json"
 
-# Initialize the OpenAI client
-client = OpenAI(api_key=OPENAI_API_KEY)
-
 credentials = service_account.Credentials.from_service_account_file(
     service_account_key_path
 )
@@ -78,27 +75,9 @@ def standardize_data(array_of_strings):
     return standardized_array
 
 
-def get_embedding(text, max_retries=50):
-    retries = 0
-    while retries < max_retries:
-        try:
-            response = client.embeddings.create(
-                input=[text.replace("\n", " ")],  # Input as a list
-                model="text-embedding-3-small",
-            )
-            return np.array(response.data[0].embedding)
-
-        except Exception as e:
-            retries += 1
-            delay = min(random.uniform(2, 4) * (2**retries), 60)
-            logging.error(
-                f"General error: {e}. Retrying in {delay:.2f} seconds... (Attempt {retries}/{max_retries})"
-            )
-            time.sleep(delay)
-
-    raise Exception(
-        f"Failed to process after {max_retries} retries due to persistent errors."
-    )
+def get_embedding(text):
+    # Requests from concurrent callers are coalesced into batched API calls
+    return embed_text(text)
 
 
 def calculate_similarity(row):
@@ -138,7 +117,6 @@ def get_embedding_if_valid(text):
 
 
 def run_openai_api(text, page_text, heading_type):
-    client = OpenAI(api_key=OPENAI_API_KEY)
     PROMPT = (
         generate_prompt(text, page_text, heading_type)
         + "\n\nPlease respond with a comma-separated list only, no other text."
@@ -146,8 +124,8 @@ def run_openai_api(text, page_text, heading_type):
 
     try:
         # Send the request to OpenAI
-        response = client.chat.completions.create(
-            model="gpt-4o-mini-2024-07-18",
+        response = chat_completion(
+            "outline_keywords",
             messages=[{"role": "user", "content": PROMPT}],
             max_tokens=MAX_TOKEN_LIMIT,
             temperature=0,
@@ -202,26 +180,23 @@ def extract_keywords_row_level(row, reference_keywords_obj):
     h2_1 = row.get("H2-1")
     h2_2 = row.get("H2-2")
 
-    if title:
-        heading_type = "Title"
-        reference_keywords_obj["title_tag"]["keywords"] = run_openai_api(
-            title, page_text, heading_type
-        )
-    if h1_1:
-        heading_type = "H1-1"
-        reference_keywords_obj["h1-1"]["keywords"] = run_openai_api(
-            h1_1, page_text, heading_type
-        )
-    if h2_1:
-        heading_type = "H2-1"
-        reference_keywords_obj["h2_1"]["keywords"] = run_openai_api(
-            h2_1, page_text, heading_type
-        )
-    if h2_2:
-        heading_type = "H2-2"
-        reference_keywords_obj["h2_2"]["keywords"] = run_openai_api(
-            h2_2, page_text, heading_type
-        )
+    # Heading type and text of each tag, keyed by its entry in reference_keywords_obj
+    tags = {
+        "title_tag": ("Title", title),
+        "h1-1": ("H1-1", h1_1),
+        "h2_1": ("H2-1", h2_1),
+        "h2_2": ("H2-2", h2_2),
+    }
+    tags = {tag: heading for tag, heading in tags.items() if heading[1]}
+
+    # The extractions are independent, so they run concurrently
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(len(tags), 1)) as executor:
+        futures = {
+            tag: executor.submit(run_openai_api, text, page_text, heading_type)
+            for tag, (heading_type, text) in tags.items()
+        }
+    for tag, future in futures.items():
+        reference_keywords_obj[tag]["keywords"] = future.result()
     return reference_keywords_obj
 
 
@@ -294,48 +269,37 @@ def generate_prompt(text, page_text, heading_type):
     return PROMPT
 
 
-loaded_index = faiss.read_index("faiss_TF_index.bin")
-print(loaded_index)
-
-
 def normalize_embeddings(embeddings):
     norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
     return embeddings / norms
 
 
-def match_keyword(keyword, threshold=0.65):
-    # Convert keyword to embedding and normalize it
-    embedding = np.array(get_embedding(keyword)).astype("float32")
-    normalized_embedding = normalize_embeddings(embedding.reshape(1, -1))
-
-    # Perform the search in the FAISS index
-    distances, _ = loaded_index.search(normalized_embedding, k=1)
-
-    # Convert L2 distance to cosine similarity
-    l2_distance = distances[0][0]
-    similarity = 1 - (l2_distance / 2)
-
-    print(
-        f"Keyword: {keyword}, Cosine similarity: {similarity}, Threshold: {threshold}"
-    )
-
-    # Return 1 if similarity meets the threshold, otherwise return None
-    return 1 if similarity >= threshold else None
-
-
-def update_priority(row):
-    match = match_keyword(row["keyword"])
-
-    if match is not None:  # Only update if a match above threshold is found
-        print(f"Updating priority for keyword: {row['keyword']}")
-        return 1  # Set priority to 1 if match meets threshold
-    print(f"Retaining original priority for keyword: {row['keyword']}")
-    return row["priority"]  # Return existing priority if no match is found
-
-
-def process_priority(row):
-    # Process each row, calling update_priority for each row
-    return update_priority(row)
+def match_keywords(embeddings, threshold=0.65):
+    """
+    Searches all embeddings against the FAISS index in a single call.
+    Returns a boolean array, True where the nearest GSC query meets the threshold.
+    """
+    matrix = normalize_embeddings(np.vstack(embeddings).astype("float32"))
+    similarity = get_index_registry().nearest_similarity(matrix)
+    return similarity >= threshold
+
+
+def update_priorities(df, threshold=0.65):
+    """
+    Priority column for a DataFrame of keywords: 1 where the keyword matches a
+    GSC query, the existing priority otherwise.
+    """
+    priorities = df["priority"].copy()
+    valid = [
+        i for i, keyword in enumerate(df["keyword"]) if pd.notna(keyword) and keyword.strip()
+    ]
+    if valid:
+        embeddings = embed_texts([df["keyword"].iloc[i] for i in valid])
+        matches = match_keywords(embeddings, threshold)
+        matched = [i for i, match in zip(valid, matches) if match]
+        priorities.iloc[matched] = 1
+        logging.info(f"{len(matched)} of {len(df)} keywords match a GSC query")
+    return priorities
 
 
 def process_row_for_outlines(row_data_for_outlines):
@@ -361,7 +325,7 @@ def process_row_for_outlines(row_data_for_outlines):
     reference_keywords_obj["h1-1_text"] = row_data["h1-1"]
     reference_keywords_obj["h2-1_text"] = row_data["H2-1"]
     reference_keywords_obj["h2-2_text"] = row_data["H2-2"]
-    reference_keywords_obj["page_text_txt"] = row_data["page_text"]
+    reference_keywords_obj["page_text_txt"] = row_data["page_copy"]
 
     processed_data = extract_keywords_row_level(row_data, reference_keywords_obj)
     print("********Processed_data:*********", processed_data)
@@ -409,10 +373,6 @@ def process_row_for_outlines(row_data_for_outlines):
     # Drop duplicates while keeping the first occurrence (which will be 'h1' if available)
     df_flattened = df_flattened.drop(columns=["tag_priority"])
 
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        priority_results = list(
-            executor.map(process_priority, df_flattened.to_dict("records"))
-        )
-    print("priority_results:", priority_results)
-    df_flattened["priority"] = priority_results
+    df_flattened["priority"] = update_priorities(df_flattened)
+    print("priority_results:", df_flattened["priority"].tolist())
     return df_flattened
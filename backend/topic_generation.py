@@ -1,19 +1,18 @@
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from openai import OpenAI
+from cachetools import TTLCache
 import pandas as pd
-import openai
 import re
 import time
 import logging
 import os
+import threading
 from dotenv import load_dotenv
+from embedding_cache import normalize_text
+from llm_gateway import chat_completion, model_for
 
 load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
-# Initialize OpenAI client
-openai_client = OpenAI(api_key=OPENAI_API_KEY)
-
 project_id = "halcyon-414514"
 dataset_id = "B_n_Q"
 difficulty_table = "Topic_SubTopic_V4_data"
@@ -26,46 +25,54 @@ logging.basicConfig(
 # Global variable to track token usage
 total_tokens_used = 0
 
+# Topic/subtopic responses are reused for the same keyword set for this many seconds
+TOPIC_CACHE_TTL = int(os.getenv("TOPIC_CACHE_TTL", str(7 * 24 * 3600)))
+TOPIC_CACHE_MAX_ITEMS = int(os.getenv("TOPIC_CACHE_MAX_ITEMS", "20000"))
+
+topic_cache = TTLCache(maxsize=TOPIC_CACHE_MAX_ITEMS, ttl=TOPIC_CACHE_TTL)
+topic_cache_lock = threading.Lock()
+topic_cache_stats = {"hits": 0, "misses": 0}
+
 
-def run_openai_api(prompt, max_retries=10):
+def topic_cache_info():
+    """Hits, misses, hit rate and entries of the topic response cache"""
+    with topic_cache_lock:
+        counts = dict(topic_cache_stats)
+        entries = len(topic_cache)
+    lookups = counts["hits"] + counts["misses"]
+    return {
+        **counts,
+        "hit_rate": round(counts["hits"] / lookups, 4) if lookups else 0.0,
+        "entries": entries,
+    }
+
+
+def run_openai_api(prompt):
     """
-    Calls the OpenAI Chat Completion API with retry logic.
+    Calls the OpenAI Chat Completion API; rate limits are retried by the
+    LLM gateway.
     """
-    retries = 0
-    backoff_factor = 2
-    delay = 1
-
-    while retries < max_retries:
-        try:
-            response = openai_client.chat.completions.create(
-                model="gpt-4o-mini-2024-07-18",
-                messages=[
-                    {"role": "system", "content": "You are an intelligent SEO Expert."},
-                    {"role": "user", "content": prompt},
-                ],
-                max_tokens=1000,
-                temperature=0.0,
-            )
+    try:
+        response = chat_completion(
+            "topics",
+            messages=[
+                {"role": "system", "content": "You are an intelligent SEO Expert."},
+                {"role": "user", "content": prompt},
+            ],
+            max_tokens=1000,
+            temperature=0.0,
+        )
 
-            result_content = response.choices[0].message.content
-            tokens_used = response.usage.total_tokens
+        result_content = response.choices[0].message.content
+        tokens_used = response.usage.total_tokens
 
-            global total_tokens_used
-            total_tokens_used += tokens_used
+        global total_tokens_used
+        total_tokens_used += tokens_used
 
-            return result_content
-        except openai.RateLimitError as e:
-            retries += 1
-            logging.warning(
-                f"Rate limit error: {e}. Retrying in {delay:.2f} seconds... (Attempt {retries}/{max_retries})"
-            )
-            time.sleep(delay)
-            delay *= backoff_factor
-        except Exception as e:
-            logging.error(f"Error in OpenAI API call: {e}")
-            raise
-
-    raise Exception("Failed after max retries due to rate limit or other issues.")
+        return result_content
+    except Exception as e:
+        logging.error(f"Error in OpenAI API call: {e}")
+        raise
 
 
 # Function to extract topic and subtopic
@@ -215,45 +222,74 @@ def construct_prompt(keywords):
                 Keywords: {keywords}"""
 
 
+def topic_cache_key(keywords, model=None):
+    """
+    Cache key of a comma separated keyword set: the same keywords in any
+    order, case or spacing, with duplicates, give the same key.
+    """
+    model = model or model_for("topics")
+    canonical = {normalize_text(keyword).lower() for keyword in keywords.split(",")}
+    canonical.discard("")
+    return model, tuple(sorted(canonical))
+
+
 def apply_openai_api(keywords):
     """
     Calls the OpenAI API for a given keyword and processes the response.
+    Responses are cached per keyword set, failed calls are not.
     """
+    key = topic_cache_key(keywords)
+    with topic_cache_lock:
+        response = topic_cache.get(key)
+        topic_cache_stats["hits" if response is not None else "misses"] += 1
+    if response is not None:
+        return response
+
     try:
         prompt = construct_prompt(keywords)
         response = run_openai_api(prompt)
-        return response
     except Exception as e:
         logging.error(f"Error processing keyword '{keywords}': {e}")
         return None
 
+    if response is not None:
+        with topic_cache_lock:
+            topic_cache[key] = response
+    return response
+
 
 def process_row_parallel(keywords_list, max_workers=5):
     """
     Processes rows in parallel using ThreadPoolExecutor.
+    Keyword sets that are identical after canonicalisation are sent once.
     """
     responses = [None] * len(
         keywords_list
     )  # Initialize the responses list with None values
 
+    indexes_by_key = {}
+    for index, keywords in enumerate(keywords_list):
+        indexes_by_key.setdefault(topic_cache_key(keywords), []).append(index)
+
     with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        # Submit all jobs and store future-to-index mapping
-        future_to_index = {
-            executor.submit(apply_openai_api, keywords): index
-            for index, keywords in enumerate(keywords_list)
+        # Submit one job per distinct keyword set and store future-to-indexes mapping
+        future_to_indexes = {
+            executor.submit(apply_openai_api, keywords_list[indexes[0]]): indexes
+            for indexes in indexes_by_key.values()
         }
 
         # Collect results as they complete
-        for future in as_completed(future_to_index):
-            index = future_to_index[future]  # Get the index of the keyword in the list
+        for future in as_completed(future_to_indexes):
+            indexes = future_to_indexes[future]
             try:
                 response = future.result()
-                responses[index] = response  # Store the result at the correct index
             except Exception as e:
                 logging.error(
-                    f"Error processing keywords '{keywords_list[index]}': {e}"
+                    f"Error processing keywords '{keywords_list[indexes[0]]}': {e}"
                 )
-                responses[index] = None  # If error occurs, store None at the index
+                response = None  # If error occurs, store None at the indexes
+            for index in indexes:
+                responses[index] = response  # Store the result at the correct index
 
     return responses
 
@@ -9,7 +9,7 @@ import secrets
 import json
 from google.cloud import bigquery
 from google.oauth2 import service_account
-from openai import OpenAI
+import asyncio
 import json
 import time
 import re
@@ -20,14 +20,22 @@ import ast
 from sklearn.metrics.pairwise import cosine_similarity
 import logging
 import os
-import faiss
 from concurrent.futures import ThreadPoolExecutor
 import concurrent.futures
-import random
 from clustering import cluster_existing_embeddings, analyze_clusters
 from topic_generation import process_row_parallel, extract_topic_subtopic
 from database import get_db_cursor
-from prompts import system_message, generate_prompt, generate_synonym_prompt
+from prompts import (
+    system_message,
+    generate_prompt,
+    generate_synonym_prompt,
+    generate_batch_intent_prompt,
+)
+from embedding_service import embed_text, embed_texts
+from llm_gateway import chat_completion, async_chat_completion, model_for
+from intent_cache import get_intent_cache
+from index_registry import get_index_registry
+from cluster_store import get_cluster_store
 import os
 from dotenv import load_dotenv
 
@@ -43,6 +51,14 @@ GOOGLE_CLIENT_ID = "your-google-client-id"
 
 total_tokens_used = 0
 MAX_TOKEN_LIMIT = 1000
+# Keywords classified per batched intent request
+INTENT_BATCH_SIZE = int(os.getenv("INTENT_BATCH_SIZE", "50"))
+# Completion tokens allowed per keyword in a batched intent request
+INTENT_TOKENS_PER_KEYWORD = 12
+INTENT_LABELS = {
+    label.lower(): label
+    for label in ["Informational", "Navigational", "Commercial", "Transactional"]
+}
 project_id = "thermofigher-gen-ai"
 dataset_id = "research_data"
 scraped_table_name = "biopharma_data"
@@ -58,8 +74,6 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 security = HTTPBearer()
-client = OpenAI(api_key=OPENAI_API_KEY)
-
 credentials = service_account.Credentials.from_service_account_file(
     service_account_key_path
 )
@@ -122,26 +136,9 @@ def standardize_data(array_of_strings):
     return standardized_array
 
 
-def get_embedding(text, max_retries=50):
-    retries = 0
-    while retries < max_retries:
-        try:
-            response = client.embeddings.create(
-                input=[text.replace("\n", " ")],  # Input as a list
-                model="text-embedding-3-small",
-            )
-            return np.array(response.data[0].embedding)
-        except Exception as e:
-            retries += 1
-            delay = min(random.uniform(2, 4) * (2**retries), 60)
-            logging.error(
-                f"General error: {e}. Retrying in {delay:.2f} seconds... (Attempt {retries}/{max_retries})"
-            )
-            time.sleep(delay)
-
-    raise Exception(
-        f"Failed to process after {max_retries} retries due to persistent errors."
-    )
+def get_embedding(text):
+    # Requests from concurrent callers are coalesced into batched API calls
+    return embed_text(text)
 
 
 def calculate_similarity(row):
@@ -180,59 +177,123 @@ def get_embedding_if_valid(text):
         return None
 
 
-def analyze_intent(keyword, retries=3):
+def get_embeddings_if_valid(texts):
+    """Embed a list of texts in batched requests, None for empty or missing texts"""
+    valid = [i for i, text in enumerate(texts) if pd.notna(text) and text.strip()]
+    embeddings = [None] * len(texts)
+    for i, embedding in zip(valid, embed_texts([texts[i] for i in valid])):
+        embeddings[i] = embedding
+    return embeddings
+
+
+async def analyze_intent_async(keyword):
     test_messages = [
         {"role": "system", "content": system_message},
         {"role": "user", "content": keyword},
     ]
-    client = OpenAI(api_key=OPENAI_API_KEY)
-    for attempt in range(retries):
-        try:
-            response = client.chat.completions.create(
-                model="ft:gpt-4o-mini-2024-07-18:brainlabs:tf-intent-classifier:AH9Zsveq",
-                # model="gpt-4o",
-                messages=test_messages,
-                max_tokens=MAX_TOKEN_LIMIT,
-                temperature=0,
-            )
-            return response.choices[0].message.content
+    try:
+        response = await async_chat_completion(
+            "intent",
+            messages=test_messages,
+            max_tokens=MAX_TOKEN_LIMIT,
+            temperature=0,
+        )
+        return response.choices[0].message.content
+    except Exception as e:
+        logging.error(f"Error analysing intent of '{keyword}': {e}")
+        return None
 
-        except Exception as e:
-            time.sleep(1)  # Wait for a second before retrying
-            if attempt == retries - 1:
-                return None  # Return None if all attempts fail
 
+def parse_intent_batch(content, count):
+    """
+    Per-keyword intents from a batched classifier response.
+    Returns: list of `count` intents, or None if the response doesn't parse
+    """
+    try:
+        intents = json.loads(content)["intents"]
+    except (TypeError, ValueError, KeyError) as e:
+        logging.warning(f"Unparseable batched intent response: {e}")
+        return None
+    if not isinstance(intents, list) or len(intents) != count:
+        logging.warning("Batched intent response has the wrong number of intents")
+        return None
+
+    parsed = []
+    for intent in intents:
+        labels = [
+            INTENT_LABELS.get(label.strip().lower()) for label in str(intent).split("|")
+        ]
+        if not all(labels):
+            logging.warning(f"Unknown intent in batched response: {intent}")
+            return None
+        parsed.append("|".join(labels))
+    return parsed
 
-# Function to apply intent analysis concurrently
-def apply_intent_analysis(df):
-    # Create a new column for the analyzed intent
-    df["analysed_intent"] = None
 
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        # Submit tasks to the executor for concurrent processing
-        future_to_keyword = {
-            executor.submit(analyze_intent, row["keyword"]): idx
-            for idx, row in df.iterrows()
-        }
+def intent_batch_messages(keywords):
+    return [
+        {"role": "system", "content": system_message},
+        {"role": "user", "content": generate_batch_intent_prompt(keywords)},
+    ]
 
-        # Retrieve results and store them in the new column
-        for future in concurrent.futures.as_completed(future_to_keyword):
-            idx = future_to_keyword[future]
-            try:
-                result = future.result()
-                df.at[idx, "analysed_intent"] = result
-            except Exception as exc:
-                print(f"Keyword analysis generated an exception for index {idx}: {exc}")
 
-    return df
+async def classify_intent_batch_async(keywords):
+    """Intents of `keywords` in one request, falling back to one call per keyword"""
+    try:
+        response = await async_chat_completion(
+            "intent_batch",
+            messages=intent_batch_messages(keywords),
+            max_tokens=INTENT_TOKENS_PER_KEYWORD * len(keywords) + 20,
+            temperature=0,
+            response_format={"type": "json_object"},
+        )
+        intents = parse_intent_batch(response.choices[0].message.content, len(keywords))
+    except Exception as e:
+        logging.error(f"Batched intent request failed: {e}")
+        intents = None
+    if intents is not None:
+        return intents
+    return await asyncio.gather(*[analyze_intent_async(keyword) for keyword in keywords])
+
+
+def uncached_intents(keywords):
+    """
+    Look `keywords` up in the intent cache.
+    Returns: ({keyword: intent} found, [distinct keywords to classify])
+    """
+    found = get_intent_cache().get_many(model_for("intent"), keywords)
+    missing = list(dict.fromkeys(keyword for keyword in keywords if keyword not in found))
+    return found, missing
+
+
+def intent_batches(keywords):
+    size = max(INTENT_BATCH_SIZE, 1)
+    return [keywords[i : i + size] for i in range(0, len(keywords), size)]
+
+
+async def classify_intents_async(keywords):
+    """
+    Intents of `keywords`, served from the persistent intent cache where
+    possible and classified INTENT_BATCH_SIZE keywords per request otherwise.
+    Returns: list of intents (None where classification failed)
+    """
+    found, missing = uncached_intents(keywords)
+    if missing:
+        batches = intent_batches(missing)
+        results = await asyncio.gather(
+            *[classify_intent_batch_async(batch) for batch in batches]
+        )
+        for batch, intents in zip(batches, results):
+            new = dict(zip(batch, intents))
+            await asyncio.to_thread(get_intent_cache().put_many, model_for("intent"), new)
+            found.update(new)
+    return [found.get(keyword) for keyword in keywords]
 
 
 def run_openai_api(text, reference_keywords, page_text=None):
-    client = OpenAI(api_key=OPENAI_API_KEY)
     PROMPT = generate_prompt(text, reference_keywords, page_text)
-    response = client.chat.completions.create(
-        model="gpt-4o-2024-05-13",
-        # model="gpt-4o",
+    response = chat_completion(
+        "keywords",
         messages=[{"role": "user", "content": PROMPT}],
         max_tokens=MAX_TOKEN_LIMIT,
         temperature=0,
@@ -257,37 +318,35 @@ def extract_keywords_row_level(row, reference_keywords_obj, distinct_keywords):
     h2_1 = row.get("H2-1")
     h2_2 = row.get("H2-2")
 
-    if meta_desc:
-        reference_keywords_obj["meta_desc"]["keywords"] = standardize_data(
-            run_openai_api(meta_desc, distinct_keywords, page_text)
-        )
+    # Text of each tag, keyed by its entry in reference_keywords_obj
+    tags = {"meta_desc": meta_desc, "h1-1": h1_1, "h2_1": h2_1, "h2_2": h2_2}
     # if page_text:
     #     reference_keywords_obj['page_text']['keywords'] = standardize_data(run_openai_api(page_text, distinct_keywords,page_text))
-    if h1_1:
-        reference_keywords_obj["h1-1"]["keywords"] = standardize_data(
-            run_openai_api(h1_1, distinct_keywords, page_text)
-        )
-    if h2_1:
-        reference_keywords_obj["h2_1"]["keywords"] = standardize_data(
-            run_openai_api(h2_1, distinct_keywords, page_text)
-        )
-    if h2_2:
-        reference_keywords_obj["h2_2"]["keywords"] = standardize_data(
-            run_openai_api(h2_2, distinct_keywords, page_text)
-        )
+    tags = {tag: text for tag, text in tags.items() if text}
+
+    # The extractions are independent, so they run concurrently
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(len(tags), 1)) as executor:
+        futures = {
+            tag: executor.submit(run_openai_api, text, distinct_keywords, page_text)
+            for tag, text in tags.items()
+        }
+    for tag, future in futures.items():
+        reference_keywords_obj[tag]["keywords"] = standardize_data(future.result())
     return reference_keywords_obj
 
 
-def extract_synonyms_from_openai(reference_keyword, pg_txt):
-    client = OpenAI(api_key=OPENAI_API_KEY)
+async def extract_synonyms_from_openai_async(reference_keyword, pg_txt):
     PROMPT = generate_synonym_prompt(reference_keyword, pg_txt)
-    response = client.chat.completions.create(
-        model="gpt-4o-2024-05-13",
-        # model="gpt-4o",
+    response = await async_chat_completion(
+        "synonyms",
         messages=[{"role": "user", "content": PROMPT}],
         max_tokens=MAX_TOKEN_LIMIT,
         temperature=0,
     )
+    return parse_synonyms(response)
+
+
+def parse_synonyms(response):
     obj = json.loads(response.json())
     synonyms = obj["choices"][0]["message"]["content"]
     tokens_used = obj["usage"]["total_tokens"]
@@ -394,11 +453,8 @@ def process_embedding(row):
 
 
 # def compute_embeddings(df):
-def extract_synonyms_concurrently(row):
-    # Each row performs synonym extraction
-    df_synonyms = extract_synonyms_from_openai(row["keyword"], row["page_text_txt"])
-
-    if not df_synonyms.empty:
+def synonym_rows(row, df_synonyms):
+    if df_synonyms is not None and not df_synonyms.empty:
         df_synonyms["is_synonym"] = 1
         df_synonyms["origin_url"] = row["origin_url"]
         df_synonyms["title_tag_text"] = row["title_tag_text"]
@@ -406,6 +462,7 @@ def extract_synonyms_concurrently(row):
         df_synonyms["h2-1_text"] = row["h2-1_text"]
         df_synonyms["h2-2_text"] = row["h2-2_text"]
         df_synonyms["page_text_txt"] = row["page_text_txt"]
+        df_synonyms["page_text_prompt"] = row["page_text_prompt"]
         df_synonyms["url_slug"] = row["url_slug"]
         df_synonyms["tag_type"] = row["tag_type"]
         df_synonyms["priority"] = row["priority"]
@@ -417,55 +474,35 @@ def extract_synonyms_concurrently(row):
     return []
 
 
-def process_synonym_extraction(df_flattened):
+async def process_synonym_extraction_async(df_flattened):
+    """Synonyms of every keyword row; all rows are requested concurrently"""
+    rows = df_flattened.to_dict("records")
+    results = await asyncio.gather(
+        *[
+            extract_synonyms_from_openai_async(row["keyword"], row["page_text_prompt"])
+            for row in rows
+        ]
+    )
     processed_rows = []
-
-    with concurrent.futures.ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
-        # Process each row concurrently
-        results = list(
-            executor.map(extract_synonyms_concurrently, df_flattened.to_dict("records"))
-        )
-
-        for result in results:
-            processed_rows.extend(result)
-
+    for row, df_synonyms in zip(rows, results):
+        processed_rows.extend(synonym_rows(row, df_synonyms))
     return pd.DataFrame(processed_rows)
 
 
-def compute_embeddings(df):
-    max_workers = min(
-        os.cpu_count(), len(df)
-    )  # Limit workers to either CPU cores or number of rows
-
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        # Parallel execution for embedding generation (keyword embeddings generated per row)
-        futures = {
-            "keyword": {
-                executor.submit(get_embedding_if_valid, keyword): idx
-                for idx, keyword in enumerate(df["keyword"])
-            }
-        }
-
-        # Compute h1 and title embeddings once (since they are the same for all rows)
-        h1_text = (
-            df["h1-1_text"].iloc[0] if not df["h1-1_text"].isnull().all() else None
-        )
-        title_text = (
-            df["title_tag_text"].iloc[0]
-            if not df["title_tag_text"].isnull().all()
-            else None
-        )
-
-        h1_text_embedding = get_embedding_if_valid(h1_text) if h1_text else None
-        title_tag_embedding = get_embedding_if_valid(title_text) if title_text else None
+def compute_embeddings(df, embed_many=get_embeddings_if_valid):
+    # Compute h1 and title embeddings once (since they are the same for all rows)
+    h1_text = df["h1-1_text"].iloc[0] if not df["h1-1_text"].isnull().all() else None
+    title_text = (
+        df["title_tag_text"].iloc[0] if not df["title_tag_text"].isnull().all() else None
+    )
 
-        # Assign embeddings for keyword and reuse for h1 and title
-        df["keyword_embedding"] = [None] * len(df)
-        df["h1_text_embedding"] = [h1_text_embedding] * len(df)
-        df["title_tag_embedding"] = [title_tag_embedding] * len(df)
+    # Keyword, h1 and title embeddings are requested together in batches
+    embeddings = embed_many(list(df["keyword"]) + [h1_text, title_text])
+    h1_text_embedding, title_tag_embedding = embeddings[-2:]
 
-        for future, idx in futures["keyword"].items():
-            df.at[idx, "keyword_embedding"] = future.result()
+    df["keyword_embedding"] = pd.Series(embeddings[:-2], index=df.index, dtype=object)
+    df["h1_text_embedding"] = [h1_text_embedding] * len(df)
+    df["title_tag_embedding"] = [title_tag_embedding] * len(df)
 
     # Combine text
     df["combined_text"] = df.apply(
@@ -485,9 +522,7 @@ def compute_embeddings(df):
     combined_text = (
         df["combined_text"].iloc[0] if not df["combined_text"].isnull().all() else None
     )
-    combined_embedding = (
-        get_embedding_if_valid(combined_text) if combined_text else None
-    )
+    combined_embedding = embed_many([combined_text])[0] if combined_text else None
     df["combined_embedding"] = [combined_embedding] * len(df)
 
     # Calculate similarity score in vectorized manner
@@ -508,10 +543,12 @@ def compute_embeddings(df):
     return df
 
 
-loaded_index = faiss.read_index("faiss_TF_index.bin")
-
-
 def clustering(embedding_data):
+    """
+    Topic and subtopic for every keyword. Keywords close to a cluster in the
+    persisted cluster store reuse its labels; the rest are clustered and only
+    those new clusters are sent for topic generation, then stored.
+    """
     try:
         # Convert the loaded data into a pandas DataFrame
         df = pd.DataFrame(embedding_data)
@@ -520,29 +557,51 @@ def clustering(embedding_data):
         if "embedding" not in df.columns:
             raise ValueError("No 'embedding' column found in the data")
 
-        # Perform clustering
-        df_clustered = cluster_existing_embeddings(
-            df=df, keyword_col="keyword", embedding_col="embedding", min_similarity=0.85
+        df["topic"], df["subtopic"], df["cluster_id"] = None, None, -1
+        store = get_cluster_store()
+        valid = df["embedding"].map(
+            lambda emb: isinstance(emb, (list, np.ndarray)) and len(emb) > 0
+        )
+        if valid.any():
+            assigned = store.assign(np.vstack(df.loc[valid, "embedding"].map(np.asarray)))
+            df.loc[valid, ["cluster_id", "topic", "subtopic"]] = assigned
+        new_df = df[df["cluster_id"] == -1]
+        logging.info(
+            f"{len(df) - len(new_df)} of {len(df)} keywords assigned to stored clusters"
         )
 
-        # Analyze results
-        analysis = analyze_clusters(df_clustered)
+        if not new_df.empty:
+            # Perform clustering
+            df_clustered = cluster_existing_embeddings(
+                df=new_df, keyword_col="keyword", embedding_col="embedding", min_similarity=0.85
+            )
 
-        ##topic generation
-        keywords_list = [",".join(i) for i in analysis["keywords"].tolist()]
+            # Analyze results
+            analysis = analyze_clusters(df_clustered)
 
-        analysis["response"] = process_row_parallel(keywords_list)
+            ##topic generation
+            keywords_list = [",".join(i) for i in analysis["keywords"].tolist()]
 
-        analysis[["Topic", "Subtopic"]] = analysis["response"].apply(
-            lambda x: pd.Series(extract_topic_subtopic(x))
-        )
-        topic, subtopic = [], []
-        for i, row in df_clustered.iterrows():
-            df = analysis[analysis["cluster_id"] == row.cluster_id]
-            topic.append(df.iloc[0].Topic)
-            subtopic.append(df.iloc[0].Subtopic)
-        df_clustered["topic"], df_clustered["subtopic"] = topic, subtopic
-        df_clustered = df_clustered[["keyword", "topic", "subtopic", "cluster_id"]]
+            analysis["response"] = process_row_parallel(keywords_list)
+
+            analysis[["Topic", "Subtopic"]] = analysis["response"].apply(
+                lambda x: pd.Series(extract_topic_subtopic(x))
+            )
+            for row in analysis.itertuples():
+                members = df_clustered.index[df_clustered["cluster_id"] == row.cluster_id]
+                # Keywords without a valid embedding are always in the noise
+                # group (see cluster_existing_embeddings), so they get the
+                # noise group's labels but never reach the store
+                if row.cluster_id == -1 or not row.Topic or not row.Subtopic:
+                    # Noise and failed or unparseable generations are not stored
+                    df.loc[members, ["topic", "subtopic"]] = [row.Topic, row.Subtopic]
+                    continue
+                vectors = np.vstack(df_clustered.loc[members, "embedding"].map(np.asarray))
+                df.loc[members, ["cluster_id", "topic", "subtopic"]] = store.add(
+                    vectors, row.Topic, row.Subtopic
+                )
+
+        df_clustered = df[["keyword", "topic", "subtopic", "cluster_id"]]
         return df_clustered.to_dict()
     except Exception as e:
         print(f"Error in main execution: {str(e)}")
@@ -554,32 +613,40 @@ def normalize_embeddings(embeddings):
     return embeddings / norms
 
 
-def match_keyword(keyword, threshold=0.85):
-    # Convert keyword to embedding and normalize it
-    embedding = np.array(get_embedding(keyword)).astype("float32")
-    normalized_embedding = normalize_embeddings(embedding.reshape(1, -1))
-
-    # Perform the search in the FAISS index
-    distances, _ = loaded_index.search(normalized_embedding, k=1)
-
-    # Convert L2 distance to cosine similarity
-    l2_distance = distances[0][0]
-    similarity = 1 - (l2_distance / 2)
-    # Return 1 if similarity meets the threshold, otherwise return None
-    return 1 if similarity >= threshold else None
-
-
-def update_priority(row):
-    match = match_keyword(row["keyword"])
-
-    if match is not None:  # Only update if a match above threshold is found
-        return 1  # Set priority to 1 if match meets threshold
-    return row["priority"]  # Return existing priority if no match is found
+def match_keywords(embeddings, threshold=0.85):
+    """
+    Searches all embeddings against the FAISS index in a single call.
+    Returns a boolean array, True where the nearest GSC query meets the threshold.
+    """
+    matrix = normalize_embeddings(np.vstack(embeddings).astype("float32"))
+    similarity = get_index_registry().nearest_similarity(matrix)
+    return similarity >= threshold
 
 
-def process_priority(row):
-    # Process each row, calling update_priority for each row
-    return update_priority(row)
+def update_priorities(df, threshold=0.85):
+    """
+    Priority column for a DataFrame of keywords: 1 where the keyword matches a
+    GSC query, the existing priority otherwise.
+    Reuses the keyword_embedding column when present.
+    """
+    if "keyword_embedding" in df.columns:
+        embeddings = list(df["keyword_embedding"])
+    else:
+        embeddings = [None] * len(df)
+
+    # Embed keywords that have no embedding yet
+    missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+    for i, embedding in zip(
+        missing, get_embeddings_if_valid([df["keyword"].iloc[i] for i in missing])
+    ):
+        embeddings[i] = embedding
+
+    priorities = df["priority"].copy()
+    valid = [i for i, embedding in enumerate(embeddings) if embedding is not None]
+    if valid:
+        matches = match_keywords([embeddings[i] for i in valid], threshold)
+        priorities.iloc[[i for i, match in zip(valid, matches) if match]] = 1
+    return priorities
 
 
 def get_user_by_email(email: str):
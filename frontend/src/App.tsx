@@ -2,7 +2,7 @@ import { BrowserRouter as Router, Routes, Route, Navigate } from 'react-router-d
 import { ProtectedRoute } from './components/ProtectedRoute'
 import LoginPage from './app/login/page'
 import RegisterPage from './app/register/page'
-import { useState, useEffect } from 'react'
+import { useState, useEffect, useRef } from 'react'
 // import { Input } from "@/components/ui/input"
 // import { Button } from "@/components/ui/button"
 // import { Card, CardContent, CardFooter, CardHeader, CardTitle } from "@/components/ui/card"
@@ -14,6 +14,20 @@ import { DataTable } from '@/components/DataTable'
 import { MainForm } from '@/components/MainForm'
 import { API_BASE_URL } from '@/config'
 
+const emptyModifiedContentMetrics: ModifiedContentMetrics = {
+  url_slug: {},
+  content_length_original: {},
+  content_length_modified: {},
+  keyword_count_original: {},
+  keyword_count_modified: {},
+  keyword_density_original: {},
+  keyword_density_modified: {},
+  keywords_incorporated: {},
+  outline_count_original: {},
+  outline_count_modified: {},
+  outlines_incorporated: {}
+}
+
 function App() {
   const [theme, setTheme] = useState(() => {
     // Check if there's a saved theme preference in localStorage
@@ -118,19 +132,28 @@ function App() {
   const [contentSummaryData, setContentSummaryData] = useState<ContentSummary[]>([])
   const [competitorRankingData, setCompetitorRankingData] = useState<CompetitorRanking[]>([])
   const [modifiedContent, setModifiedContent] = useState<(string | number)[]>([])
-  const [modifiedContentMetrics, setModifiedContentMetrics] = useState<ModifiedContentMetrics>({
-    url_slug: {},
-    content_length_original: {},
-    content_length_modified: {},
-    keyword_count_original: {},
-    keyword_count_modified: {},
-    keyword_density_original: {},
-    keyword_density_modified: {},
-    keywords_incorporated: {},
-    outline_count_original: {},
-    outline_count_modified: {},
-    outlines_incorporated: {}
-  })
+  const [modifiedContentMetrics, setModifiedContentMetrics] = useState<ModifiedContentMetrics>(emptyModifiedContentMetrics)
+  // Stream of the job in progress, if any
+  const eventSourceRef = useRef<EventSource | null>(null)
+
+  const closeStream = () => {
+    eventSourceRef.current?.close();
+    eventSourceRef.current = null;
+  };
+
+  // Stop listening to the job stream when the app unmounts
+  useEffect(() => {
+    return () => eventSourceRef.current?.close();
+  }, []);
+
+  const resetJobState = () => {
+    setKeywordData([]);
+    setTopicClusterData([]);
+    setContentSummaryData([]);
+    setCompetitorRankingData([]);
+    setModifiedContent([]);
+    setModifiedContentMetrics(emptyModifiedContentMetrics);
+  };
 
  
 
@@ -153,50 +176,52 @@ function App() {
   };
 
   const handleMainFormSubmit = async (formData: FormData) => {
+    // A new run replaces the previous one: stop its stream and clear its results
+    closeStream();
+    resetJobState();
     setIsLoading(true);
-    try {
-      const response = await fetch(`${API_BASE_URL}/process_row`, {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        body: JSON.stringify({ url: formData.url }),
-      });
-
-      if (!response.ok) {
-        throw new Error('Network response was not ok');
-      }
+    setSubmittedUrl(formData.url);
 
-      const data = await response.json();
-      console.log('API Response:', data);
-      
-      // Set keyword metrics data
-      setKeywordData(data.keyword_metrics);
-      
-      // Process and set topic cluster data
-      const processedTopicData = processTopicClusterData(data.topic_ai_cluster);
-      setTopicClusterData(processedTopicData);
+    // Each section of the response is streamed as its own event as soon as it is ready
+    const source = new EventSource(
+      `${API_BASE_URL}/process_row/stream?url=${encodeURIComponent(formData.url)}`
+    );
+    eventSourceRef.current = source;
+    let receivedData = false;
 
-      // Set competitor ranking data
-      setCompetitorRankingData(data.competitor_ranking);
+    const handleSection = <T,>(section: string, setter: (data: T) => void) => {
+      source.addEventListener(section, (event) => {
+        const data = JSON.parse((event as MessageEvent).data);
+        console.log(`API Response (${section}):`, data);
+        setter(data);
+        if (!receivedData) {
+          receivedData = true;
+          setSelectedCategory('Keyword');
+        }
+      });
+    };
 
-      // Set content summary data
-      setContentSummaryData(data.content_summary);
+    handleSection<KeywordMetric[]>('keyword_metrics', setKeywordData);
+    handleSection<TopicClusterResponse>('topic_ai_cluster', (data) =>
+      setTopicClusterData(processTopicClusterData(data))
+    );
+    handleSection<CompetitorRanking[]>('competitor_ranking', setCompetitorRankingData);
+    handleSection<ContentSummary[]>('content_summary', setContentSummaryData);
+    handleSection<(string | number)[]>('modified_content', setModifiedContent);
+    handleSection<ModifiedContentMetrics>('modified_content_metrics', setModifiedContentMetrics);
 
-      // Set modified content data
-      setModifiedContent(data.modified_content);
+    source.addEventListener('done', () => {
+      closeStream();
+      setIsLoading(false);
+    });
 
-      // Set modified content metrics
-      setModifiedContentMetrics(data.modified_content_metrics);
-      
-      setSubmittedUrl(formData.url);
-      setSelectedCategory('Keyword');
-    } catch (error) {
+    const handleError = (error: Event) => {
       console.error('Error:', error);
-      alert('Not enough keywords. Please try again or try with different url.');
-    } finally {
+      closeStream();
       setIsLoading(false);
-    }
+      alert('Not enough keywords. Please try again or try with different url.');
+    };
+    source.addEventListener('error', handleError);
   };
 
   return (